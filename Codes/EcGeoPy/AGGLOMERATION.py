@@ -0,0 +1,123 @@
+#!/usr/bin/python3.11
+# -*- coding: utf-8 -*-
+
+# Agglomeration (geographic concentration) of industries, from employment
+# data in the same layout as the input of 'rca':
+#        Row: Industry/Product/ etc.
+#        Col: Region
+#
+# Output: one value per industry (row).
+#
+# Negative values will be treated as zero.
+
+
+import numpy as np
+from .RCA import rca, is_sparse
+from .INEQUALITY import gini_byClass, herfindahl_grouped
+
+
+def industry_region_shares(mat) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    '''
+    Return (mat, ind_sum, reg_share): 'mat' with negative values set to zero
+    (a copy only when needed), the total of each industry, and the share of
+    each region in the total of all industries (x_r).
+    '''
+    if is_sparse(mat):
+        mat = mat.maximum(0) if mat.min() < 0 else mat;
+        ind_sum = np.asarray(mat.sum(axis = 1)).ravel().astype(float);
+        reg_sum = np.asarray(mat.sum(axis = 0)).ravel().astype(float);
+    else:
+        mat = np.maximum(mat, 0) if mat.min() < 0 else mat;
+        ind_sum = mat.sum(axis = 1, dtype = float);
+        reg_sum = mat.sum(axis = 0, dtype = float);
+    return (mat, ind_sum, reg_sum / reg_sum.sum());
+
+
+
+def ellison_glaeser(mat,
+                    plant_hhi:np.ndarray | None = None,
+                    plant_emp:np.ndarray | None = None,
+                    plant_industry:np.ndarray | None = None) -> np.ndarray:
+    '''
+    Generate the Ellison-Glaeser index of agglomeration of every industry:
+
+        gamma_i = (G_i - (1 - sum(x_r^2)) H_i) / ((1 - sum(x_r^2)) (1 - H_i))
+
+    with G_i = sum_r (s_ir - x_r)^2 the raw geographic concentration, s_ir
+    the share of region r in industry i, x_r the share of region r in the
+    total of all industries, and H_i the plant Herfindahl index of industry i.
+
+    Parameters:
+    -----
+    mat: numpy 2-d array (or scipy sparse matrix) of employment.
+         Row: Industry
+         Col: Region
+    plant_hhi: numpy 1-d array. The plant Herfindahl index of each industry
+         (row of 'mat'). Either this, or 'plant_emp' and 'plant_industry',
+         must be supplied.
+    plant_emp: numpy 1-d array. Employment of each plant.
+    plant_industry: numpy 1-d array of integers. The industry (row number of
+         'mat') of each plant. The plant Herfindahl indices are then computed
+         in one grouped pass (see INEQUALITY.herfindahl_grouped).
+    '''
+    if mat.ndim != 2:
+        raise ValueError("'mat' must be a 2-d array, but currently its dimension is {}.".format(mat.ndim));
+    n_ind = mat.shape[0];
+
+    if plant_hhi is None:
+        if plant_emp is None or plant_industry is None:
+            raise ValueError("Either 'plant_hhi', or both 'plant_emp' and 'plant_industry', must be supplied.");
+        plant_industry = np.asarray(plant_industry);
+        if len(plant_industry) > 0 and (plant_industry.min() < 0 or plant_industry.max() >= n_ind):
+            raise ValueError("'plant_industry' must be row numbers of 'mat', i.e. between 0 and {}.".format(n_ind-1));
+        (HHI, industries) = herfindahl_grouped(plant_emp, plant_industry, top_k = ());
+        plant_hhi = np.full(n_ind, np.nan);
+        plant_hhi[industries] = HHI['hhi'];
+    else:
+        plant_hhi = np.asarray(plant_hhi, dtype = float);
+        if plant_hhi.shape != (n_ind,):
+            raise ValueError("'plant_hhi' must have one element per row of 'mat' ({a}), but currently its shape is {b}.".format(a=n_ind, b=plant_hhi.shape));
+
+    (mat, ind_sum, reg_share) = industry_region_shares(mat);
+
+    # G = sum(s^2) - 2 sum(s x) + sum(x^2), without an array of s - x
+    if is_sparse(mat):
+        sq_sum = np.asarray(mat.multiply(mat).sum(axis = 1)).ravel();
+    else:
+        sq_sum = np.einsum('ij,ij->i', mat, mat, dtype = float);
+    x2_sum = reg_share @ reg_share;
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        G = sq_sum / (ind_sum*ind_sum) - 2 * (mat @ reg_share) / ind_sum + x2_sum;
+        GAMMA = (G - (1 - x2_sum) * plant_hhi) / ((1 - x2_sum) * (1 - plant_hhi));
+
+    return GAMMA;
+
+
+
+def locational_gini(mat) -> np.ndarray:
+    '''
+    Generate the locational Gini index (Krugman) of every industry: the Gini
+    index of the location quotients (RCA) of the industry across regions,
+    with each region weighted by its share in the total of all industries.
+    It is 0 when the industry is distributed like the total, and close to 1
+    when it is concentrated in a few small regions.
+
+    Parameters:
+    -----
+    mat: numpy 2-d array (or scipy sparse matrix) of employment.
+         Row: Industry
+         Col: Region
+    '''
+    if mat.ndim != 2:
+        raise ValueError("'mat' must be a 2-d array, but currently its dimension is {}.".format(mat.ndim));
+
+    if is_sparse(mat):
+        (mat, ind_sum, reg_share) = industry_region_shares(mat);
+        LQ = rca(mat).toarray();
+    else:
+        # Integer employment is cast to float (a copy) for the shares and LQ
+        (mat, ind_sum, reg_share) = industry_region_shares(mat.astype(float));
+        LQ = rca(mat);
+
+    # Regions are the "classes" of the Gini index, industries its columns
+    return gini_byClass(LQ.T, reg_share);
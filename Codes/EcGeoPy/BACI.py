@@ -0,0 +1,247 @@
+#!/usr/bin/python3.11
+# -*- coding: utf-8 -*-
+
+# Loading CEPII-BACI trade data (CSV files with the columns t, i, j, k, v, q:
+# year, exporter, importer, product, value and quantity) straight into the
+# matrices used by the other modules:
+#        Row: Product
+#        Col: Region (exporter), or exporter x importer for a 3-d array
+#
+# The file is parsed in chunks of text by numpy into typed columns (int64
+# codes, product codes as text with their leading zeros, float values), the
+# codes are turned into row/column numbers with np.unique, and the values are
+# added into the matrix with np.bincount, so that there is no Python work per
+# row.
+# Files with other columns (e.g. the HS2 aggregates "i,hs2,v" used in the
+# examples) work the same way, with the names in their header.
+
+
+import io
+import re
+import numpy as np
+
+try:
+    import scipy.sparse as sps;
+except ImportError:
+    sps = None;
+
+
+# Columns read as float; all the others are codes, read as int64, or as text
+# (e.g. HS codes, to keep their leading zeros) when listed in 'str_columns'
+BACI_FLOAT_COLUMNS = ['v', 'q'];
+BACI_STR_COLUMNS = ['k'];
+
+# A whole field "NA" (quoted or not), but not "NA" within other text: after
+# a comma, or at the start of a line
+NA_FIELD = re.compile(r',[ \t]*"?NA"?[ \t]*(?=,|$)', re.M);
+NA_FIRST_FIELD = re.compile(r'^[ \t]*"?NA"?[ \t]*(?=,|$)', re.M);
+
+
+def read_baci(path: str,
+              columns: list | None = None,
+              str_columns: list | None = None,
+              chunk_bytes: int = 2**26) -> dict:
+    '''
+    Read a BACI CSV file into numpy arrays, one per column.
+
+    Parameters
+    -----
+    path: string. Path of the CSV file, with a header line.
+
+    columns: list of strings. Optional. Names of the columns to keep (e.g.
+             ['i', 'k', 'v']). All columns by default.
+
+    str_columns: list of strings. Optional. Code columns kept as text, e.g.
+             product codes with leading zeros ("010121"). Default ['k'].
+
+    chunk_bytes: integer. Size of the pieces of text parsed at a time.
+             Default 64 MB.
+
+    Returns
+    -----
+    dict of column name => numpy 1-d array. "v" and "q" are float64 (with
+    NaN for "NA" fields), the columns in 'str_columns' are text, and the
+    other columns int64 (parsed as integers, so exact for any code).
+    '''
+    str_columns = BACI_STR_COLUMNS if str_columns is None else str_columns;
+    with open(path, 'r') as f:
+        header = [x.strip().strip('"') for x in f.readline().split(',')];
+        if columns is None:
+            columns = header;
+        missing = [x for x in columns if x not in header];
+        if len(missing) > 0:
+            raise ValueError("The following columns are not in the header of '{a}': {b}.".format(a=path, b=missing));
+        usecols = [header.index(x) for x in columns];
+        dtype = np.dtype([(name, float if name in BACI_FLOAT_COLUMNS else 'U16' if name in str_columns else np.int64)
+                          for name in columns]);
+
+        pieces = [];
+        rest = '';
+        while True:
+            text = f.read(chunk_bytes);
+            if text == '':
+                break;
+            text = rest + text;
+            cut = text.rfind('\n') + 1;
+            (text, rest) = (text[:cut], text[cut:]);
+            if text.strip() != '':
+                pieces.append(parse_baci_text(text, usecols, dtype));
+        if rest.strip() != '':
+            pieces.append(parse_baci_text(rest, usecols, dtype));
+
+    data = np.concatenate(pieces) if len(pieces) > 0 else np.zeros(0, dtype = dtype);
+    return {name: np.ascontiguousarray(data[name]) for name in columns};
+
+
+
+def parse_baci_text(text: str, usecols: list, dtype: np.dtype) -> np.ndarray:
+    '''
+    Parse lines of a BACI file into a structured array of 'dtype', one typed
+    field per column. Fields can be quoted (e.g. "010121"), and missing
+    quantities are written as NA.
+    '''
+    text = text.replace('\r', '');
+    if 'NA' in text:
+        text = NA_FIRST_FIELD.sub('nan', NA_FIELD.sub(',nan', text));
+    return np.loadtxt(io.StringIO(text), delimiter = ',', quotechar = '"',
+                      usecols = usecols, dtype = dtype, ndmin = 1);
+
+
+
+def factorize(codes: np.ndarray,
+              labels: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray]:
+    '''
+    Turn codes into numbers 0, 1, ... (e.g. rows of a matrix).
+
+    Parameters
+    -----
+    codes: numpy 1-d array.
+    labels: numpy 1-d array. Optional. Fixed sorted set of codes to use (e.g.
+            all the countries in another dataset). Codes not in 'labels' get
+            the number -1.
+
+    Returns
+    -----
+    (labels, index): the sorted unique codes (or the given 'labels'), and the
+         position of each element of 'codes' in 'labels'.
+    '''
+    if labels is None:
+        codes = np.asarray(codes);
+        if np.issubdtype(codes.dtype, np.integer) and len(codes) > 0 and codes.min() >= 0 and codes.max() < 4 * len(codes) + 2**16:
+            # Small non-negative integer codes (the usual case for BACI and
+            # region/industry codes): counting instead of sorting
+            isUsed = np.bincount(codes) > 0;
+            labels = np.flatnonzero(isUsed).astype(codes.dtype);
+            number = np.cumsum(isUsed) - 1;
+            return (labels, number[codes]);
+        (labels, index) = np.unique(codes, return_inverse = True);
+        return (labels, index.ravel());
+
+    labels = np.asarray(labels);
+    if np.any(labels[1:] <= labels[:-1]):
+        raise ValueError("'labels' must be sorted and unique.");
+    index = np.searchsorted(labels, codes);
+    isIn = index < len(labels);
+    isIn[isIn] = labels[index[isIn]] == codes[isIn];
+    index[~isIn] = -1;
+    return (labels, index);
+
+
+
+def baci_matrix(data: dict,
+                rows: str = 'k',
+                cols: str | tuple = 'i',
+                value: str = 'v',
+                row_labels: np.ndarray | None = None,
+                col_labels: np.ndarray | list | None = None,
+                sparse: bool = False):
+    '''
+    Sum the values of BACI records (as from 'read_baci') into a product x
+    region matrix, or a product x exporter x importer array.
+
+    Parameters
+    -----
+    data: dict of column name => numpy 1-d array, e.g. from 'read_baci'.
+          Filter it beforehand for a subset (e.g. a year, with data['t']).
+
+    rows: string. Column giving the rows (default 'k', product).
+
+    cols: string, or a tuple of two strings. Column(s) giving the columns
+          (default 'i', exporter). With ('i', 'j'), a 3-d array of products
+          x exporters x importers is returned.
+
+    value: string. Column summed in each cell (default 'v'). NaN are ignored.
+
+    row_labels, col_labels: numpy 1-d arrays. Optional. Fixed sorted sets of
+          codes for the rows and the columns (a list of two for a tuple
+          'cols'); records with other codes are left out. By default, all the
+          codes in the data are used.
+
+    sparse: bool. Return a scipy sparse (CSR) matrix instead of a numpy
+          array. Only for 2-d outputs. Default False.
+
+    Returns
+    -----
+    (mat, row_labels, col_labels): the matrix, and the code of each row and
+         column (for a tuple 'cols', 'col_labels' is a list of two arrays).
+    '''
+    col_names = [cols] if isinstance(cols, str) else list(cols);
+    if len(col_names) not in [1, 2]:
+        raise ValueError("'cols' must be one column name, or a tuple of two, but currently it is {}.".format(cols));
+    if sparse and len(col_names) == 2:
+        raise ValueError("A sparse matrix can only be 2-d, so 'cols' must be one column name when 'sparse' is True.");
+    if sparse and sps is None:
+        raise ValueError("'sparse' needs scipy, which is not installed.");
+    missing = [x for x in [rows, value] + col_names if x not in data];
+    if len(missing) > 0:
+        raise ValueError("The following columns are not in 'data': {}.".format(missing));
+    if len(col_names) == 1:
+        col_labels = [col_labels];
+    elif col_labels is None:
+        col_labels = [None, None];
+
+    (row_labels, row_idx) = factorize(data[rows], row_labels);
+    factorized = [factorize(data[name], lab) for (name, lab) in zip(col_names, col_labels)];
+    col_labels = [lab for (lab, idx) in factorized];
+
+    shape = [len(row_labels)] + [len(lab) for lab in col_labels];
+    isIn = (row_idx >= 0) & ~np.isnan(data[value]);
+    for (lab, idx) in factorized:
+        isIn &= idx >= 0;
+    cell = np.ravel_multi_index([row_idx[isIn]] + [idx[isIn] for (lab, idx) in factorized], shape);
+    val = data[value][isIn];
+
+    if sparse:
+        (r, c) = np.unravel_index(cell, shape);
+        mat = sps.csr_matrix((val, (r, c)), shape = shape);
+        mat.sum_duplicates();
+    else:
+        mat = np.bincount(cell, weights = val, minlength = int(np.prod(shape))).reshape(shape);
+
+    return (mat, row_labels, col_labels[0] if len(col_labels) == 1 else col_labels);
+
+
+
+def load_baci(path: str,
+              year: int | None = None,
+              rows: str = 'k',
+              cols: str | tuple = 'i',
+              value: str = 'v',
+              row_labels: np.ndarray | None = None,
+              col_labels: np.ndarray | list | None = None,
+              sparse: bool = False,
+              str_columns: list | None = None,
+              chunk_bytes: int = 2**26):
+    '''
+    Read a BACI CSV file and return (mat, row_labels, col_labels), see
+    'read_baci' and 'baci_matrix'. If 'year' is supplied, only the records
+    of that year (column 't') are used.
+    '''
+    col_names = [cols] if isinstance(cols, str) else list(cols);
+    columns = [rows] + col_names + [value] + ([] if year is None else ['t']);
+    data = read_baci(path, columns = list(dict.fromkeys(columns)), str_columns = str_columns, chunk_bytes = chunk_bytes);
+    if year is not None:
+        isYear = data['t'] == year;
+        data = {name: x[isYear] for (name, x) in data.items()};
+    return baci_matrix(data, rows = rows, cols = cols, value = value,
+                       row_labels = row_labels, col_labels = col_labels, sparse = sparse);
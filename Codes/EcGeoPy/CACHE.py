@@ -0,0 +1,313 @@
+#!/usr/bin/python3.11
+# -*- coding: utf-8 -*-
+
+# Opt-in memoization of expensive results ('rca', 'relatedness', 'pci_eig',
+# 'eci_eig' and 'rel_density'), across calls and, with a directory, across
+# sessions:
+#
+#   cache = egp.ResultCache(max_bytes = 2**30, directory = 'egp_cache')
+#   egp.set_cache(cache)
+#   ...                       # same calls as usual
+#   cache.stats()             # hits / misses / evictions
+#   egp.set_cache(None)       # back to no caching
+#
+# Entries are keyed on the function, the version of EcGeoPy, the parameters
+# and a blake2b fingerprint of the bytes (with dtype and shape) of the input
+# arrays. They are kept in memory up to 'max_bytes', dropping the least
+# recently used first, and (for numpy arrays) in .npy files of 'directory'
+# up to 'max_disk_bytes', dropping the least recently used files first.
+#
+# The cache keeps its own (read-only) copy of each result and hands a fresh
+# copy to every caller, so that results can be changed in place as without
+# the cache (e.g. by 'entropy', which zeroes negative values). Labeled
+# inputs are not cached themselves: the functions call themselves on the
+# bare values, which are.
+
+
+import os
+import hashlib
+import inspect
+import functools
+from collections import OrderedDict
+import numpy as np
+from .LABELED import is_labeled
+from .VERSION import __VERSION__
+
+try:
+    import scipy.sparse as sps;
+except ImportError:
+    sps = None;
+
+
+ACTIVE_CACHE = None;
+
+
+def fingerprint(x, chunk_rows: int = 4096) -> str:
+    '''
+    blake2b hex digest of an array (numpy or scipy sparse) or of a plain
+    parameter (number, string, None, tuple/list of these).
+    '''
+    h = hashlib.blake2b(digest_size = 20);
+    if sps is not None and sps.issparse(x):
+        X = sps.csr_matrix(x);
+        X.sum_duplicates();
+        h.update('sparse:{a}:{b}'.format(a=X.dtype.str, b=X.shape).encode());
+        for part in [X.indptr, X.indices, X.data]:
+            h.update(np.ascontiguousarray(part).data);
+    elif isinstance(x, np.ndarray):
+        h.update('array:{a}:{b}'.format(a=x.dtype.str, b=x.shape).encode());
+        if x.ndim == 0:
+            h.update(x.tobytes());
+        for start in range(0, x.shape[0] if x.ndim > 0 else 0, chunk_rows):
+            h.update(np.ascontiguousarray(x[start:start+chunk_rows]).data);
+    elif isinstance(x, (tuple, list)):
+        h.update('seq:'.encode());
+        for item in x:
+            h.update(fingerprint(item).encode());
+    elif x is None or isinstance(x, (bool, int, float, str, np.generic)):
+        h.update('{a}:{b!r}'.format(a=type(x).__name__, b=x).encode());
+    else:
+        raise ValueError("Cannot fingerprint an object of type {}.".format(type(x).__name__));
+    return h.hexdigest();
+
+
+
+def result_bytes(value) -> int:
+    if sps is not None and sps.issparse(value):
+        X = sps.csr_matrix(value);
+        return X.data.nbytes + X.indices.nbytes + X.indptr.nbytes;
+    return value.nbytes;
+
+
+
+def private_copy(value):
+    '''
+    A read-only copy of a result, kept by the cache.
+    '''
+    return read_only(value.copy());
+
+
+
+def read_only(value):
+    if isinstance(value, np.ndarray):
+        value.setflags(write = False);
+    elif sps is not None and sps.issparse(value):
+        for part in [value.data, getattr(value, 'indices', None), getattr(value, 'indptr', None)]:
+            if isinstance(part, np.ndarray):
+                part.setflags(write = False);
+    return value;
+
+
+
+class ResultCache:
+    '''
+    Two-tier cache of results: in memory (least recently used first out,
+    bounded by bytes) and, optionally, on disk as .npy files.
+
+    Parameters
+    -----
+    max_bytes: integer. Total size of the results kept in memory. Default
+               256 MB.
+    directory: string. Optional. Directory of the disk tier (created if
+               missing). No disk tier by default.
+    max_disk_bytes: integer. Total size of the files of the disk tier.
+               Default 2 GB.
+    '''
+    def __init__(self,
+                 max_bytes: int = 2**28,
+                 directory: str | None = None,
+                 max_disk_bytes: int = 2**31):
+        self.max_bytes = max_bytes;
+        self.directory = directory;
+        self.max_disk_bytes = max_disk_bytes;
+        self.memory = OrderedDict();
+        self.memory_bytes = 0;
+        self.counts = {'hits_memory': 0, 'hits_disk': 0, 'misses': 0,
+                       'evictions_memory': 0, 'evictions_disk': 0};
+        if directory is not None:
+            os.makedirs(directory, exist_ok = True);
+
+
+    def __repr__(self):
+        return 'ResultCache({a} entries, {b} bytes in memory)'.format(a=len(self.memory), b=self.memory_bytes);
+
+
+    def key(self, func, bound: dict) -> str:
+        '''
+        Key of the call of 'func' with the (name => value) arguments 'bound'.
+        '''
+        h = hashlib.blake2b(digest_size = 20);
+        h.update('{a}.{b}:{c}'.format(a=func.__module__, b=func.__qualname__, c=__VERSION__).encode());
+        for (name, value) in bound.items():
+            h.update(name.encode());
+            h.update(fingerprint(value).encode());
+        return h.hexdigest();
+
+
+    def get(self, key: str):
+        '''
+        A copy of the result of 'key', or None when it is not cached.
+        '''
+        if key in self.memory:
+            self.memory.move_to_end(key);
+            self.counts['hits_memory'] += 1;
+            return self.memory[key][0].copy();
+
+        path = self.disk_path(key);
+        if path is not None and os.path.exists(path):
+            try:
+                value = np.load(path, allow_pickle = False);
+            except (OSError, ValueError):
+                # e.g. a file being written by another process
+                value = None;
+            if value is not None:
+                os.utime(path);
+                self.counts['hits_disk'] += 1;
+                self.put_memory(key, read_only(value));
+                return value.copy();
+
+        self.counts['misses'] += 1;
+        return None;
+
+
+    def put(self, key: str, value):
+        '''
+        Keep a copy of 'value' as the result of 'key'; 'value' itself is left
+        to the caller.
+        '''
+        stored = private_copy(value);
+        self.put_memory(key, stored);
+        if self.directory is not None and isinstance(stored, np.ndarray) and stored.dtype != object:
+            self.put_disk(key, stored);
+        return value;
+
+
+    def put_memory(self, key: str, value):
+        size = result_bytes(value);
+        if size > self.max_bytes:
+            return;
+        if key in self.memory:
+            self.memory_bytes -= self.memory.pop(key)[1];
+        self.memory[key] = (value, size);
+        self.memory_bytes += size;
+        while self.memory_bytes > self.max_bytes:
+            (old_key, (old_value, old_size)) = self.memory.popitem(last = False);
+            self.memory_bytes -= old_size;
+            self.counts['evictions_memory'] += 1;
+
+
+    def disk_path(self, key: str) -> str | None:
+        if self.directory is None:
+            return None;
+        return os.path.join(self.directory, key + '.npy');
+
+
+    def put_disk(self, key: str, value: np.ndarray):
+        if value.nbytes > self.max_disk_bytes:
+            return;
+        path = self.disk_path(key);
+        temp_path = path + '.{}.tmp'.format(os.getpid());
+        with open(temp_path, 'wb') as f:
+            np.save(f, value, allow_pickle = False);
+        os.replace(temp_path, path);
+        self.evict_disk();
+
+
+    def evict_disk(self):
+        '''
+        Remove the least recently used files until the disk tier fits in
+        'max_disk_bytes'.
+        '''
+        files = [(e.stat().st_mtime, e.stat().st_size, e.path) for e in os.scandir(self.directory)
+                 if e.is_file() and e.name.endswith('.npy')];
+        total = sum(f[1] for f in files);
+        for (mtime, size, path) in sorted(files):
+            if total <= self.max_disk_bytes:
+                break;
+            try:
+                os.remove(path);
+            except FileNotFoundError:
+                pass;
+            total -= size;
+            self.counts['evictions_disk'] += 1;
+
+
+    def disk_bytes(self) -> int:
+        if self.directory is None:
+            return 0;
+        return sum(e.stat().st_size for e in os.scandir(self.directory)
+                   if e.is_file() and e.name.endswith('.npy'));
+
+
+    def stats(self) -> dict:
+        '''
+        Hits (in memory, on disk), misses and evictions so far, with the
+        number of entries and bytes in memory and the bytes on disk.
+        '''
+        out = dict(self.counts);
+        lookups = out['hits_memory'] + out['hits_disk'] + out['misses'];
+        out['hit_rate'] = (out['hits_memory'] + out['hits_disk']) / lookups if lookups > 0 else 0.0;
+        out['entries_memory'] = len(self.memory);
+        out['bytes_memory'] = self.memory_bytes;
+        out['bytes_disk'] = self.disk_bytes();
+        return out;
+
+
+    def clear(self, disk: bool = False):
+        '''
+        Empty the memory tier (and the disk tier if 'disk' is True), and
+        reset the statistics.
+        '''
+        self.memory.clear();
+        self.memory_bytes = 0;
+        for name in self.counts:
+            self.counts[name] = 0;
+        if disk and self.directory is not None:
+            for e in os.scandir(self.directory):
+                if e.is_file() and e.name.endswith('.npy'):
+                    os.remove(e.path);
+
+
+
+def set_cache(cache: ResultCache | None):
+    '''
+    Use 'cache' for the results of the memoized functions from now on, or
+    stop caching with None.
+    '''
+    global ACTIVE_CACHE;
+    ACTIVE_CACHE = cache;
+
+
+
+def get_cache() -> ResultCache | None:
+    return ACTIVE_CACHE;
+
+
+
+def memoize(func):
+    '''
+    Decorator caching the results of 'func' in the active cache (see
+    'set_cache'). Without an active cache, or with labeled inputs, 'func' is
+    simply called.
+    '''
+    signature = inspect.signature(func);
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        cache = ACTIVE_CACHE;
+        if cache is None:
+            return func(*args, **kwargs);
+        bound = signature.bind(*args, **kwargs);
+        bound.apply_defaults();
+        if any(is_labeled(x) for x in bound.arguments.values()):
+            return func(*args, **kwargs);
+        try:
+            key = cache.key(func, bound.arguments);
+        except ValueError:
+            return func(*args, **kwargs);
+        value = cache.get(key);
+        if value is None:
+            value = cache.put(key, func(*args, **kwargs));
+        return value;
+
+    return wrapper;
@@ -3,7 +3,10 @@
 
 
 import numpy as np
-from .RCA import rca
+from .RCA import rca, is_sparse
+from .PAIRWISE import row_blocks, top_k
+from .LABELED import LabeledMatrix, align_cols, unlabeled
+from .CACHE import memoize
 
 def rel_asymmetric(mat:np.ndarray, weight:np.ndarray|None = None) -> np.ndarray:
     '''Hidalgo's asymetric version of relatedness between two items, based on
@@ -63,57 +66,85 @@ def rel_symmetric(mat:np.ndarray, weight:np.ndarray|None = None) -> np.ndarray:
     return np.minimum(Phi_asym, Phi_asym.T);
 
 
-def jaccard_normalization(co_occur_mat:np.ndarray) -> np.ndarray:
+def jaccard_normalization(co_occur_mat:np.ndarray,
+                          co0:np.ndarray|None = None,
+                          co1:np.ndarray|None = None) -> np.ndarray:
     '''
     Jaccard normalisation
     Input: numpy 2-d array. Must have a square shape.
            Matrix for the count of co-occurance in i and j
+    
+    co0, co1: Optional. Column sums (shape 1 x n) and row sums (shape b x 1)
+           of the full co-occurance matrix. When supplied, 'co_occur_mat'
+           can be a block of b rows of the full matrix, with its diagonal
+           already set to zero.
     '''
-    co0 = co_occur_mat.sum(axis = 0, keepdims = True);
-    co1 = co_occur_mat.sum(axis = 1, keepdims = True);
+    isBlock = co0 is not None;
+    co0 = co_occur_mat.sum(axis = 0, keepdims = True) if co0 is None else co0.copy();
+    co1 = co_occur_mat.sum(axis = 1, keepdims = True) if co1 is None else co1.copy();
     co0[co0==0] = 12345;
     co1[co1==0] = 54321;
     J = co_occur_mat/(co0 + co1 - co_occur_mat);
-    np.fill_diagonal(J, 0);
+    if not isBlock:
+        np.fill_diagonal(J, 0);
     return J;
 
-def cosine_normalization(co_occur_mat:np.ndarray) -> np.ndarray:
+def cosine_normalization(co_occur_mat:np.ndarray,
+                         co0:np.ndarray|None = None,
+                         co1:np.ndarray|None = None) -> np.ndarray:
     '''
     Cosine similarity normalisation
     Input: numpy 2-d array. Must have a square shape.
            Matrix for the count of co-occurance in i and j
+    
+    co0, co1: Optional. Column and row sums of the full co-occurance matrix,
+           see 'jaccard_normalization'.
     '''
-    co0 = co_occur_mat.sum(axis = 0, keepdims = True);
-    co1 = co_occur_mat.sum(axis = 1, keepdims = True);
+    isBlock = co0 is not None;
+    co0 = co_occur_mat.sum(axis = 0, keepdims = True) if co0 is None else co0.copy();
+    co1 = co_occur_mat.sum(axis = 1, keepdims = True) if co1 is None else co1.copy();
     co0[co0==0] = 12345;
     co1[co1==0] = 54321;
     Cosplay = co_occur_mat/np.sqrt(co0 * co1);
-    np.fill_diagonal(Cosplay, 0);
+    if not isBlock:
+        np.fill_diagonal(Cosplay, 0);
     return Cosplay;
 
-def ass_str_normalization(co_occur_mat:np.ndarray) -> np.ndarray:
+def ass_str_normalization(co_occur_mat:np.ndarray,
+                          co0:np.ndarray|None = None,
+                          co1:np.ndarray|None = None) -> np.ndarray:
     '''
     Association strength normalisation
     Input: numpy 2-d array. Must have a square shape.
            Matrix for the count of co-occurance in i and j
+    
+    co0, co1: Optional. Column and row sums of the full co-occurance matrix,
+           see 'jaccard_normalization'.
     '''
-    co0 = co_occur_mat.sum(axis = 0, keepdims = True);
-    co1 = co_occur_mat.sum(axis = 1, keepdims = True);
+    isBlock = co0 is not None;
+    co0 = co_occur_mat.sum(axis = 0, keepdims = True) if co0 is None else co0.copy();
+    co1 = co_occur_mat.sum(axis = 1, keepdims = True) if co1 is None else co1.copy();
     T = co0.sum();
     co0[co0==0] = 12345;
     co1[co1==0] = 54321;
     Cosplay = T*co_occur_mat/(co0 * co1);
-    np.fill_diagonal(Cosplay, 0);
+    if not isBlock:
+        np.fill_diagonal(Cosplay, 0);
     return Cosplay;    
 
-def stijn_normalization(co_occur_mat:np.ndarray) -> np.ndarray:
+def stijn_normalization(co_occur_mat:np.ndarray,
+                        co0:np.ndarray|None = None,
+                        co1:np.ndarray|None = None) -> np.ndarray:
     '''
     Steijn probability normalisation
     Input: numpy 2-d array. Must have a square shape.
            Matrix for the count of co-occurance in i and j
+    
+    co0, co1: Optional. Column and row sums of the full co-occurance matrix,
+           see 'jaccard_normalization'.
     '''
-    co0 = co_occur_mat.sum(axis = 0, keepdims = True);
-    co1 = co_occur_mat.sum(axis = 1, keepdims = True);
+    co0 = co_occur_mat.sum(axis = 0, keepdims = True) if co0 is None else co0;
+    co1 = co_occur_mat.sum(axis = 1, keepdims = True) if co1 is None else co1;
     T = co0.sum();
     ST = co_occur_mat/( ((co0/T)*(co1/(T-co0)) + 
                          (co1/T)*(co0/(T-co1)))*(T/2));
@@ -121,6 +152,7 @@ def stijn_normalization(co_occur_mat:np.ndarray) -> np.ndarray:
     ST[np.isinf(ST)]=0;
     return ST;
 
+@memoize
 def relatedness(mat:np.ndarray, 
                 input_type:str = 'Export',
                 method: str = 'Symmetric',
@@ -154,7 +186,15 @@ def relatedness(mat:np.ndarray,
     weight: numpy 1-d array.  Optional. 
             Importance weight of each region (e.g. population, gdp size, etc). 
             Must be positive and dimension corresponds to the number of regions in mat.
+    
+    A LabeledMatrix 'mat' (with 'weight' as a LabeledVector, optionally) 
+    gives a LabeledMatrix of products x products.
     '''
+    if isinstance(mat, LabeledMatrix):
+        (mat, weight) = align_cols(mat, weight);
+        Result = relatedness(mat.values, input_type, method, unlabeled(weight));
+        return LabeledMatrix(Result, mat.row_index, mat.row_index);
+    
     if mat.ndim != 2:
         raise ValueError("'mat' must be a 2-d array, but currently its dimension is {}.".format(mat.ndim));
     
@@ -210,6 +250,124 @@ def relatedness(mat:np.ndarray,
 
 
 
+def region_similarity(mat:np.ndarray,
+                      input_type:str = 'Export',
+                      method:str = 'Cosine',
+                      weight:np.ndarray|None = None,
+                      block_size:int = 512,
+                      k:int|None = None) -> np.ndarray|tuple[np.ndarray, np.ndarray]:
+    '''
+    Generate the region x region similarity matrix, based on co-occurance of 
+    revealed comparative advantage in the same products (i.e. the "region
+    space", the counterpart of the product space from 'relatedness').
+    
+    The co-occurance matrix is computed in blocks of 'block_size' regions, 
+    so that only a block x (number of regions) matrix is held in memory at
+    a time besides the output.
+    
+    Parameters:
+    -----
+    mat: numpy 2-d array or scipy sparse matrix, either of the two:
+          * Export data (default)
+          - RCA values
+        Row: Product/Task/ etc.
+        Col: Region
+    
+    input_type: String variable indicating input type, must be one of the two
+                * "Export" => regional export data (Default)
+                - "RCA" => Value of RCAs
+                All other values will trigger an error.
+    
+    method: Method of normalising the co-occurances. Currently supporting:
+            * Cosine => Cosine similarity (default)
+            - Association => Association strength
+            - Jaccard => Jaccard similarity
+            - Steijn => Steijn's probability measure
+    
+    weight: numpy 1-d array.  Optional. 
+            Importance weight of each product. Must be positive and dimension 
+            corresponds to the number of products (rows) in mat.
+    
+    block_size: integer. Number of regions (rows of the output) computed at 
+            a time. Default 512.
+    
+    k: integer. Optional. When supplied, only the k most similar peers of
+       each region are kept, and the function returns a tuple (idx, val) of 
+       two arrays in the shape of (number of regions, k), with the column 
+       indices and the similarities of the peers, most similar first.
+       Otherwise the full square matrix is returned.
+    '''
+    if mat.ndim != 2:
+        raise ValueError("'mat' must be a 2-d array, but currently its dimension is {}.".format(mat.ndim));
+    
+    allowed_methods = ['Cosine',
+                      'Association',
+                      'Jaccard',
+                      'Steijn'];
+    if method not in allowed_methods:
+        raise ValueError("'method' must be one of: '{}'.".format("', '".join(allowed_methods)));
+    
+    allowed_types = ['RCA', 'Export'];
+    if input_type not in allowed_types:
+        raise ValueError("'input_type' must be one of: {}.".format("', '".join(allowed_types)));
+    
+    if weight is not None:
+        if weight.ndim>1:
+            raise ValueError("If 'weight' is supplied, it must be an 1-d array with the same number of elements like the number of rows of 'mat', but currently its dimension is {}.".format(weight.ndim));
+        if len(weight) != mat.shape[0]:
+            raise ValueError("'weight' must have the same number of elements like the number of rows of 'mat', but currently it has {} elements.".format(len(weight)));
+        if weight.min()<=0:
+            raise ValueError("'weight' must be positive.");
+    
+    if input_type == 'Export':
+        mat = rca(mat);
+    
+    # Region x product incidence, as float so that the products go to BLAS
+    if is_sparse(mat):
+        hasRCA = (mat.tocsr()>=1.0).astype(float).T.tocsr();
+        hasRCA_w = hasRCA if weight is None else hasRCA.multiply(weight.reshape(1,-1)).tocsr();
+    else:
+        hasRCA = (mat>=1.0).T.astype(float);
+        hasRCA_w = hasRCA if weight is None else hasRCA * weight;
+    
+    # Marginals of the full co-occurance matrix (diagonal excluded), which
+    # is symmetric so that row and column sums are the same.
+    ubiquity = np.asarray(hasRCA.sum(axis = 0)).ravel();
+    self_occur = np.asarray(hasRCA_w.sum(axis = 1)).ravel();
+    co_sum = np.asarray(hasRCA_w @ ubiquity).ravel() - self_occur;
+    co0 = co_sum.reshape(1, -1);
+    
+    normalize = {'Cosine': cosine_normalization,
+                 'Association': ass_str_normalization,
+                 'Jaccard': jaccard_normalization,
+                 'Steijn': stijn_normalization}[method];
+    
+    n = hasRCA.shape[0];
+    if k is None:
+        Result = np.zeros([n, n]);
+    else:
+        Result = (np.zeros([n, min(k, max(n-1, 1))], dtype = int),
+                  np.zeros([n, min(k, max(n-1, 1))]));
+    
+    for blk in row_blocks(n, block_size):
+        co_occur_counts = hasRCA_w[blk] @ hasRCA.T;
+        if is_sparse(co_occur_counts):
+            co_occur_counts = co_occur_counts.toarray();
+        co_occur_counts = np.asarray(co_occur_counts, dtype = float);
+        rows = np.arange(blk.stop - blk.start);
+        co_occur_counts[rows, rows + blk.start] = 0;
+        
+        sim = normalize(co_occur_counts, co0 = co0, co1 = co_sum[blk].reshape(-1, 1));
+        if k is None:
+            Result[blk] = sim;
+        else:
+            (idx, val) = top_k(sim, k, offset = blk.start);
+            Result[0][blk] = idx;
+            Result[1][blk] = val;
+    
+    return Result;
+
+
 def rescale(x:np.ndarray) ->np.ndarray:
     
     eth = x[np.isfinite(x)].min()
@@ -293,6 +451,7 @@ def eci_reflex(mat_RCA:np.ndarray, steps:int) -> np.ndarray:
 
 
 
+@memoize
 def pci_eig(mat_RCA: np.ndarray) -> np.ndarray:
     '''
     Compute complexity index of nodes using the eigenfactor method.
@@ -334,6 +493,7 @@ def pci_eig(mat_RCA: np.ndarray) -> np.ndarray:
 
 
 
+@memoize
 def eci_eig(mat_RCA: np.ndarray) -> np.ndarray:
     '''
     Compute complexity index of regions using the eigenfactor method.
@@ -375,7 +535,12 @@ def pci(mat: np.ndarray,
     steps: Integer. Only useful when 'method' is "Eigenvector". 
            Maximum allowed steps set to 25. Otherwise you'll get a warning and
            the algorithm stops at step 25...
+    
+    A LabeledMatrix 'mat' gives a LabeledVector of products.
     '''
+    if isinstance(mat, LabeledMatrix):
+        return mat.like(pci(mat.values, input_type, method, steps), cols = False);
+    
     if mat.ndim != 2:
         raise ValueError("'mat' must be a 2-d array, but currently its dimension is {}.".format(mat.ndim));
     allowed_methods = ['Eigenvector', 'Reflection'];
@@ -434,7 +599,12 @@ def eci(mat: np.ndarray,
     steps: Integer. Only useful when 'method' is "Eigenvector". 
            Maximum allowed steps set to 25. Otherwise you'll get a warning and
            the algorithm stops at step 25...
+    
+    A LabeledMatrix 'mat' gives a LabeledVector of regions.
     '''
+    if isinstance(mat, LabeledMatrix):
+        return mat.like(eci(mat.values, input_type, method, steps), rows = False);
+    
     if mat.ndim != 2:
         raise ValueError("'mat' must be a 2-d array, but currently its dimension is {}.".format(mat.ndim));
     allowed_methods = ['Eigenvector', 'Reflection'];
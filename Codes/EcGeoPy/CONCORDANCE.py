@@ -0,0 +1,236 @@
+#!/usr/bin/python3.11
+# -*- coding: utf-8 -*-
+
+# Aggregation and conversion of product classifications (e.g. HS6 -> HS4 ->
+# HS2, or HS96 -> HS12 -> HS17) on data in the same layout as the input of
+# 'rca':
+#        Row: Product (source codes)   => Row: Product (target codes)
+#        Col: Region                   => Col: Region
+#
+# A concordance table (source code, target code, optional weight) is compiled
+# once into a sparse aggregation matrix A (targets x sources), where A[t, s]
+# is the share of source code s going to target code t. Converting a matrix
+# of data X is then one sparse matrix product A @ X, for dense, sparse and
+# 3-d panel (years x products x regions) arrays alike. Many-to-many splits
+# are weights of the table; the shares of each source code sum to one, so
+# totals are kept.
+#
+# The compiled matrix is cached for each sequence of source codes (i.e. the
+# rows of the data), so that applying the same concordance to the data of
+# several years costs only the products.
+#
+# The same object gives the 'flag' of each row (its target code) for the
+# functions of VARIETY, when each source code has a single target.
+
+
+import numpy as np
+from .RCA import is_sparse
+from .LABELED import LabeledMatrix, LabelIndex
+
+try:
+    import scipy.sparse as sps;
+except ImportError:
+    sps = None;
+
+
+class Concordance:
+    '''
+    Concordance between two classifications.
+
+    Parameters
+    -----
+    source: numpy 1-d array of source codes (e.g. HS6 or HS96 codes).
+    target: numpy 1-d array of target codes (e.g. HS4 or HS17 codes), one
+            per element of 'source'.
+    weight: numpy 1-d array. Optional. Share of the source code going to the
+            target code, for many-to-many concordances. The weights of each
+            source code are normalized to sum to one. By default, a source
+            code with several targets is split equally among them.
+    '''
+    def __init__(self, source, target, weight = None):
+        source = np.asarray(source);
+        target = np.asarray(target);
+        if source.ndim != 1 or target.shape != source.shape:
+            raise ValueError("'source' and 'target' must be 1-d arrays of the same length, but currently their shapes are {a} and {b}.".format(a=source.shape, b=target.shape));
+        if weight is None:
+            weight = np.ones(len(source));
+        else:
+            weight = np.asarray(weight, dtype = float);
+            if weight.shape != source.shape:
+                raise ValueError("'weight' must have one element per element of 'source' ({a}), but currently its shape is {b}.".format(a=len(source), b=weight.shape));
+            if len(weight) > 0 and weight.min() < 0:
+                raise ValueError("Elements in 'weight' must be non-negative.");
+
+        (self.sources, src_idx) = np.unique(source, return_inverse = True);
+        (self.targets, tgt_idx) = np.unique(target, return_inverse = True);
+        (src_idx, tgt_idx) = (src_idx.ravel(), tgt_idx.ravel());
+
+        # Duplicated pairs are added, then the weights of each source are
+        # turned into shares
+        pair = src_idx * len(self.targets) + tgt_idx;
+        (pair, pair_idx) = np.unique(pair, return_inverse = True);
+        weight = np.bincount(pair_idx.ravel(), weights = weight, minlength = len(pair));
+        (src_idx, tgt_idx) = np.divmod(pair, len(self.targets));
+        src_total = np.bincount(src_idx, weights = weight, minlength = len(self.sources));
+        if np.any(src_total == 0):
+            raise ValueError("Each source code must have a positive total weight, but the following do not: {}.".format(self.sources[src_total == 0][:10].tolist()));
+
+        self.src_idx = src_idx;
+        self.tgt_idx = tgt_idx;
+        self.share = weight / src_total[src_idx];
+        self.n_targets = np.bincount(src_idx, minlength = len(self.sources));
+        self.source_index = LabelIndex(self.sources);
+        self.compiled = dict();
+
+
+    @classmethod
+    def from_dict(cls, mapping: dict) -> 'Concordance':
+        '''
+        Concordance from a dict of source code => target code.
+        '''
+        return cls(list(mapping.keys()), list(mapping.values()));
+
+
+    @classmethod
+    def from_digits(cls, codes, digits: int, code_digits: int = 6) -> 'Concordance':
+        '''
+        Concordance of integer product codes to their first 'digits' digits,
+        e.g. HS6 to HS4 with digits = 4 (code_digits = 6), i.e. 10121 => 101.
+        '''
+        if digits > code_digits:
+            raise ValueError("'digits' ({a}) cannot be more than 'code_digits' ({b}).".format(a=digits, b=code_digits));
+        codes = np.unique(np.asarray(codes, dtype = np.int64));
+        return cls(codes, codes // 10**(code_digits - digits));
+
+
+    def __repr__(self):
+        return 'Concordance({a} source codes -> {b} target codes)'.format(a=len(self.sources), b=len(self.targets));
+
+
+    def then(self, other: 'Concordance') -> 'Concordance':
+        '''
+        The concordance applying this one and then 'other', e.g. HS96 -> HS17
+        followed by HS17 -> HS4. Target codes of this one that are not source
+        codes of 'other' raise a ValueError.
+        '''
+        B = other.matrix(self.targets);
+        A = self.matrix();
+        C = sps.coo_matrix(B @ A);
+        return Concordance(self.sources[C.col], other.targets[C.row], C.data);
+
+
+    def matrix(self, labels = None, missing: str = 'raise'):
+        '''
+        The sparse (CSR) aggregation matrix, targets x rows of the data.
+
+        Parameters
+        -----
+        labels: numpy 1-d array. Optional. Source code of each row of the
+                data. All the source codes, sorted, by default.
+        missing: string. Either "raise" (default) or "drop". What to do with
+                rows whose code is not a source code: raise a ValueError, or
+                leave them out of all the targets.
+        '''
+        if sps is None:
+            raise ValueError("'Concordance' needs scipy, which is not installed.");
+        if missing not in ['raise', 'drop']:
+            raise ValueError("'missing' must be either 'raise' or 'drop', but currently it is {}.".format(missing));
+
+        if labels is None:
+            key = None;
+        else:
+            labels = np.asarray(labels);
+            key = (labels.dtype.str, labels.shape, labels.tobytes(), missing);
+        if key in self.compiled:
+            return self.compiled[key];
+
+        if labels is None:
+            (rows, col_of_source) = (len(self.sources), np.arange(len(self.sources)));
+        else:
+            pos = self.source_index.positions(labels, missing = missing);
+            # Column (row of the data) of each source code, -1 when absent
+            col_of_source = np.full(len(self.sources), -1);
+            isIn = pos >= 0;
+            col_of_source[pos[isIn]] = np.flatnonzero(isIn);
+            if len(np.unique(pos[isIn])) < np.count_nonzero(isIn):
+                raise ValueError("'labels' must be unique.");
+            rows = len(labels);
+
+        col = col_of_source[self.src_idx];
+        isIn = col >= 0;
+        A = sps.csr_matrix((self.share[isIn], (self.tgt_idx[isIn], col[isIn])),
+                           shape = (len(self.targets), rows));
+        self.compiled[key] = A;
+        return A;
+
+
+    def apply(self, mat, labels = None, missing: str = 'raise'):
+        '''
+        Convert data from the source to the target classification.
+
+        Parameters
+        -----
+        mat: numpy 1-d, 2-d or 3-d array, scipy sparse matrix, or LabeledMatrix.
+             Row: Product (source codes), or axis 1 for a 3-d array of
+                  years x products x regions.
+             Col: Region
+             With a LabeledMatrix, its row labels are the source codes.
+        labels: numpy 1-d array. Optional. Source code of each row of 'mat'.
+             All the source codes, sorted, by default.
+        missing: string. See 'matrix'.
+
+        Returns
+        -----
+        The data with one row per target code (in the order of 'targets'),
+        of the same kind as 'mat' (a LabeledMatrix labeled with the target
+        codes for a LabeledMatrix input).
+        '''
+        if isinstance(mat, LabeledMatrix):
+            values = self.apply(mat.values, mat.rows, missing);
+            return LabeledMatrix(values, self.targets, mat.col_index);
+
+        A = self.matrix(labels, missing);
+        axis = 1 if mat.ndim == 3 else 0;
+        if mat.shape[axis] != A.shape[1]:
+            raise ValueError("'mat' must have one row per source code ({a}), but currently its shape is {b}.".format(a=A.shape[1], b=mat.shape));
+
+        if is_sparse(mat):
+            return sps.csr_matrix(A @ mat);
+        if mat.ndim == 3:
+            # years x products x regions => products x (years x regions)
+            (T, n, m) = mat.shape;
+            out = A @ mat.transpose(1, 0, 2).reshape(n, T * m);
+            return out.reshape(len(self.targets), T, m).transpose(1, 0, 2);
+        return A @ mat;
+
+
+    def flag(self, labels = None, missing: str = 'raise') -> np.ndarray:
+        '''
+        Target code of each row of the data (source codes in 'labels', all the
+        source codes by default), as the 'flag' of 'unrel_variety',
+        'rel_variety' and 'entropy_decomposition'. Only for concordances where
+        each source code has a single target code.
+        '''
+        if np.any(self.n_targets > 1):
+            raise ValueError("'flag' needs each source code to have a single target, but the following have several: {}.".format(self.sources[self.n_targets > 1][:10].tolist()));
+        target_of_source = np.empty(len(self.sources), dtype = np.int64);
+        target_of_source[self.src_idx] = self.tgt_idx;
+        if labels is None:
+            return self.targets[target_of_source];
+        pos = self.source_index.positions(labels, missing = missing);
+        if np.any(pos < 0):
+            raise ValueError("'flag' needs a target code for each row, so 'missing' cannot be 'drop' when some codes are not source codes.");
+        return self.targets[target_of_source[pos]];
+
+
+
+def flag_levels(labels, *concordances) -> list:
+    '''
+    Flags of nested classifications for 'entropy_decomposition', from the
+    finest to the coarsest: the codes in 'labels', then their codes in each
+    concordance applied in turn (e.g. HS6 -> HS4, then HS4 -> HS2).
+    '''
+    flags = [np.asarray(labels)];
+    for concordance in concordances:
+        flags.append(concordance.flag(flags[-1]));
+    return flags;
@@ -0,0 +1,218 @@
+#!/usr/bin/python3.11
+# -*- coding: utf-8 -*-
+
+# Access to trade and national account data kept in SQLite databases, in
+# the layout of the example databases (see Examples/ExampleDB_Maker.py):
+#
+#   Export<year>: origin_id, hs2, exp_value    (one row per region x product)
+#   Iso3Info:     origin_id, iso3, name
+#   HsInfo:       hs2, name
+#   pwt<year>:    Penn World Table, with countrycode, pop, rgdpo, ...
+#
+# Connections are opened once per database (and thread) and reused. Query
+# results are read with fetchmany straight into a preallocated numpy array,
+# and the export data is returned as a product x region matrix with the
+# labels of its rows and columns.
+
+
+import os
+import sqlite3
+import threading
+import numpy as np
+from .BACI import factorize
+
+
+CONNECTIONS = dict();
+
+
+def check_name(name: str) -> str:
+    '''
+    Table and column names cannot be query parameters, so only plain names
+    are accepted.
+    '''
+    if not name.isidentifier():
+        raise ValueError("'{}' is not a valid table or column name.".format(name));
+    return name;
+
+
+
+def get_connection(path: str) -> sqlite3.Connection:
+    '''
+    Connection to the SQLite database at 'path', opened at the first call and
+    reused afterwards (one per thread).
+    '''
+    key = (os.path.abspath(path), threading.get_ident());
+    if key not in CONNECTIONS:
+        if not os.path.exists(path):
+            raise ValueError("The database '{}' does not exist.".format(path));
+        CONNECTIONS[key] = sqlite3.connect(path);
+    return CONNECTIONS[key];
+
+
+
+def close_connections():
+    '''
+    Close all the connections opened by 'get_connection'.
+    '''
+    for conn in CONNECTIONS.values():
+        conn.close();
+    CONNECTIONS.clear();
+
+
+
+def create_indexes(path: str, year: int = 2024):
+    '''
+    Create the indexes used by the queries of this module, if missing: on
+    (origin_id, hs2) of the table Export<year>, and on iso3 of Iso3Info.
+    '''
+    table = check_name('Export{}'.format(year));
+    conn = get_connection(path);
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_{t}_origin_hs2 ON {t} (origin_id, hs2)'.format(t = table));
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_Iso3Info_iso3 ON Iso3Info (iso3)');
+    conn.commit();
+
+
+
+def fetch_arrays(path: str,
+                 query: str,
+                 params: tuple | list = (),
+                 dtype: list | None = None,
+                 batch_size: int = 2**16) -> np.ndarray:
+    '''
+    Run a query and return the result as a numpy structured array.
+
+    Parameters
+    -----
+    path: string. Path of the SQLite database.
+    query: string. The SQL query, with '?' for the values in 'params'.
+    params: tuple or list of the values bound to the query.
+    dtype: numpy structured dtype, one field per column of the result, e.g.
+           [('origin_id', np.int64), ('exp_value', float)]. By default, all
+           the columns are float.
+    batch_size: integer. Number of rows fetched at a time. Default 65536.
+    '''
+    cursor = get_connection(path).execute(query, params);
+    if dtype is None:
+        dtype = [(d[0], float) for d in cursor.description];
+
+    # The query is run once, so the size of the result is not known: the
+    # output grows geometrically, and each batch is written into its slice
+    out = np.zeros(batch_size, dtype = dtype);
+    pos = 0;
+    while True:
+        rows = cursor.fetchmany(batch_size);
+        if len(rows) == 0:
+            break;
+        if pos + len(rows) > len(out):
+            out = np.resize(out, max(2 * len(out), pos + len(rows)));
+        out[pos:pos+len(rows)] = rows;
+        pos += len(rows);
+    cursor.close();
+    return out[:pos].copy() if pos < len(out) // 2 else out[:pos];
+
+
+
+def placeholders(values) -> str:
+    return ','.join(['?'] * len(values));
+
+
+
+def iso3_list(path: str) -> np.ndarray:
+    '''
+    Sorted iso3 codes in the table Iso3Info.
+    '''
+    rows = fetch_arrays(path, 'SELECT iso3 FROM Iso3Info', dtype = [('iso3', 'U3')]);
+    return np.unique(rows['iso3']);
+
+
+
+def export_matrix(path: str,
+                  year: int = 2024,
+                  iso3: list | np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    '''
+    Exports of each region in each product, from the table Export<year>.
+
+    Parameters
+    -----
+    path: string. Path of the SQLite database.
+    year: integer. Year of the table Export<year>. Default 2024.
+    iso3: list of iso3 codes. Optional. Only these regions are kept, one
+          column for each (all zero if the region has no exports). All the
+          regions in the table by default.
+
+    Returns
+    -----
+    (mat, products, regions): numpy 2-d array of exports, with
+          Row: Product, in the order of 'products' (sorted hs2 codes)
+          Col: Region, in the order of 'regions' (sorted iso3 codes)
+    '''
+    table = check_name('Export{}'.format(year));
+    query = '''SELECT i.iso3, e.hs2, e.exp_value
+                 FROM {t} e JOIN Iso3Info i ON i.origin_id = e.origin_id'''.format(t = table);
+    params = [];
+    if iso3 is not None:
+        iso3 = np.unique(np.asarray(iso3, dtype = 'U3'));
+        query += ' WHERE i.iso3 IN ({})'.format(placeholders(iso3));
+        params = iso3.tolist();
+    rows = fetch_arrays(path, query, params,
+                        dtype = [('iso3', 'U3'), ('hs2', np.int64), ('exp_value', float)]);
+
+    (products, row_idx) = factorize(rows['hs2']);
+    (regions, col_idx) = factorize(rows['iso3'], iso3);
+    mat = np.bincount(row_idx * len(regions) + col_idx, weights = rows['exp_value'],
+                      minlength = len(products) * len(regions)).reshape(len(products), len(regions));
+    return (mat, products, regions);
+
+
+
+def product_names(path: str) -> dict:
+    '''
+    Dict of hs2 code => name, from the table HsInfo.
+    '''
+    rows = get_connection(path).execute('SELECT hs2, name FROM HsInfo').fetchall();
+    return {x[0]: x[1].strip() for x in rows};
+
+
+
+def pwt_values(path: str,
+               columns: list,
+               year: int = 2023,
+               iso3: list | np.ndarray | None = None,
+               where: str | None = None) -> tuple[np.ndarray, np.ndarray]:
+    '''
+    Values from the Penn World Table (table pwt<year>), one row per country.
+
+    Parameters
+    -----
+    path: string. Path of the SQLite database.
+    columns: list of strings. Columns or expressions of columns (e.g.
+             'rgdpo/pop'), one column of the output for each. They are put
+             into the query as they are, so they must come from the code,
+             not from users.
+    year: integer. Year of the table pwt<year>. Default 2023.
+    iso3: list of iso3 codes. Optional. Only these countries are kept.
+    where: string. Optional. Extra condition, e.g. 'pop >= 1'.
+
+    Returns
+    -----
+    (values, countries): numpy 2-d array (countries x columns), and the
+          sorted iso3 codes of its rows.
+    '''
+    table = check_name('pwt{}'.format(year));
+    fields = [('countrycode', 'U3')] + [('c{}'.format(c), float) for c in range(len(columns))];
+    query = 'SELECT countrycode, {c} FROM {t}'.format(c = ', '.join(columns), t = table);
+    conditions = [];
+    params = [];
+    if iso3 is not None:
+        iso3 = np.unique(np.asarray(iso3, dtype = 'U3'));
+        conditions.append('countrycode IN ({})'.format(placeholders(iso3)));
+        params = iso3.tolist();
+    if where is not None:
+        conditions.append('({})'.format(where));
+    if len(conditions) > 0:
+        query += ' WHERE ' + ' AND '.join(conditions);
+    query += ' ORDER BY countrycode';
+
+    rows = fetch_arrays(path, query, params, dtype = fields);
+    values = np.column_stack([rows[f[0]] for f in fields[1:]]) if len(columns) > 0 else np.zeros([len(rows), 0]);
+    return (values, rows['countrycode']);
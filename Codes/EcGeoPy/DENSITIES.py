@@ -2,8 +2,31 @@
 # -*- coding: utf-8 -*-
 
 import numpy as np
+from .LABELED import LabeledMatrix, LabeledVector
+from .CACHE import memoize
 
 
+def align_items(relmat: LabeledMatrix, x):
+    '''
+    Rows of a LabeledMatrix or elements of a LabeledVector 'x' in the order
+    of the items of 'relmat'.
+    '''
+    if isinstance(x, LabeledMatrix):
+        return (relmat, x.select(rows = relmat.rows));
+    if isinstance(x, LabeledVector):
+        return (relmat, x.select(relmat.rows));
+    raise ValueError("When 'relmat' is a LabeledMatrix, 'hasRCA' must be a LabeledMatrix or LabeledVector.");
+
+
+
+def labeled_density(relmat: LabeledMatrix, hasRCA, RD: np.ndarray):
+    if isinstance(hasRCA, LabeledVector):
+        return LabeledVector(RD.ravel(), relmat.row_index);
+    return LabeledMatrix(RD, relmat.row_index, hasRCA.col_index);
+
+
+
+@memoize
 def rel_density(relmat:np.ndarray, hasRCA:np.ndarray)->np.ndarray:
     '''
     Compute relatedness density.
@@ -19,7 +42,16 @@ def rel_density(relmat:np.ndarray, hasRCA:np.ndarray)->np.ndarray:
             Must be either boolean, or integers of 0 and 1.
             The shape (size of 1-d array, or the number of rows for 2-d array)
             must correspond to the shape of 'relmat'.
+    
+    With a LabeledMatrix 'relmat' and a LabeledMatrix (or LabeledVector) 
+    'hasRCA', the items of 'hasRCA' are aligned with those of 'relmat', and
+    the result is labeled by item (and region).
     '''
+    if isinstance(relmat, LabeledMatrix):
+        (relmat, hasRCA) = align_items(relmat, hasRCA);
+        RD = rel_density(relmat.values, hasRCA.values);
+        return labeled_density(relmat, hasRCA, RD);
+    
     if hasRCA.ndim > 2:
         raise ValueError("'hasRCA' must be either 1-d or 2-d array, but currently its dimension is {}.".format(hasRCA.ndim));
     
@@ -74,7 +106,16 @@ def compl_rel_density(relmat:np.ndarray, hasRCA:np.ndarray, redundant_items:np.n
             'hasRCA' in case it is also an 1-d array, or have the same number
             of element as the number of rows in 'hasRCA'. 
             If a 2-d array is supplied, its shape must be the same as 'hasRCA'.
+    
+    Labeled inputs are aligned by item, as in 'rel_density'.
     '''
+    if isinstance(relmat, LabeledMatrix):
+        (relmat, hasRCA) = align_items(relmat, hasRCA);
+        if isinstance(redundant_items, (LabeledMatrix, LabeledVector)):
+            redundant_items = align_items(relmat, redundant_items)[1];
+        RD = compl_rel_density(relmat.values, hasRCA.values, getattr(redundant_items, 'values', redundant_items));
+        return labeled_density(relmat, hasRCA, RD);
+    
     if hasRCA.ndim > 2:
         raise ValueError("'hasRCA' must be either 1-d or 2-d array, but currently its dimension is {}.".format(hasRCA.ndim));
     
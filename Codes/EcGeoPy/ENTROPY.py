@@ -2,6 +2,8 @@
 # -*- coding: utf-8 -*-
 
 import numpy as np
+from .RCA import is_sparse
+from .PAIRWISE import row_blocks, top_k
 
 
 def entropy_simple(mat:np.ndarray, base:str = 'e') -> float | np.ndarray:
@@ -219,4 +221,134 @@ def kl(mat:np.ndarray, reference:np.ndarray, base:str = 'e')  -> float | np.ndar
     return Entro;
 
 
+
+
+def pairwise_divergence(mat:np.ndarray,
+                        method:str = 'KL',
+                        base:str = 'e',
+                        block_size:int = 256,
+                        k:int|None = None,
+                        dtype:type = np.float64) -> np.ndarray|tuple[np.ndarray, np.ndarray]:
+    '''
+    Divergence between the distributions of every pair of regions, i.e. the
+    region x region counterpart of 'kl'. Element [i, j] of the output is the
+    divergence of region i from region j, and for method 'KL' it is the same
+    as kl(mat[:, i], mat[:, j]).
+    
+    For 'KL' and 'SymKL', the sum(p log p) terms of each region are computed
+    once, and the cross terms sum(p log q) of a block of regions against all
+    regions are a single matrix product. 'JS' has no such decomposition, and
+    is computed by broadcasting over blocks of region pairs instead.
+    
+    Parameters:
+    -----
+    mat: numpy 2-d array or scipy sparse matrix.
+        Row: Product/Task/ etc.
+        Col: Region
+    
+    method: String variable, must be one of:
+            * "KL" => Kullback–Leibler divergence (default)
+            - "SymKL" => Symmetric KL divergence, KL(p, q) + KL(q, p)
+            - "JS" => Jensen–Shannon divergence
+    
+    base: string. Indicating base in the ln operation. Must be either 'e' 
+          (default), '2' or '10'
+    
+    block_size: integer. Number of regions (rows of the output) computed at
+          a time. Default 256.
+    
+    k: integer. Optional. When supplied, only the k nearest (i.e. least 
+       divergent) regions of each region are kept, and the function returns
+       a tuple (idx, val) of two arrays in the shape of (number of regions, k),
+       nearest first. Otherwise the full square matrix is returned.
+    
+    dtype: numpy float type used in the computation, e.g. np.float32 to halve
+          the memory and speed up the matrix products. Default np.float64.
+    '''
+    allowed_bases = ['e', '2', '10', 2, 10];
+    if base not in allowed_bases:
+        raise ValueError("'base' must be either of the following: '{}'.".format(
+            "', '".join(allowed_bases[:3])));
+    allowed_methods = ['KL', 'SymKL', 'JS'];
+    if method not in allowed_methods:
+        raise ValueError("'method' must be either of the following: '{}'.".format(
+            "', '".join(allowed_methods)));
+    if mat.ndim != 2:
+        raise ValueError("'mat' must be a 2-d array, but currently its dimension is {}.".format(mat.ndim));
+    
+    # Distributions of each region, same conventions as in 'kl'
+    if is_sparse(mat):
+        mat = mat.tocsc().astype(dtype);
+        mat.data[mat.data<0] = 0;
+        mat.eliminate_zeros();
+    else:
+        mat = np.maximum(mat, 0).astype(dtype, copy = False);
+    total = np.asarray(mat.sum(axis = 0)).ravel().astype(float);
+    total[total==0] = 6758;
     
+    n = mat.shape[1];
+    ln_base = {'e': 1.0, '2': np.log(2), 2: np.log(2), '10': np.log(10), 10: np.log(10)}[base];
+    
+    if is_sparse(mat):
+        p = mat.multiply((1/total).astype(dtype).reshape(1, -1)).tocsc();
+        # log(q), with q==0 replaced as in 'kl': a constant plus a sparse part
+        logq = p.copy();
+        logq.data = np.log(logq.data) - np.log(0.2333);
+        plogp = np.asarray(p.multiply(logq).sum(axis = 0)).ravel() + np.log(0.2333) * np.asarray(p.sum(axis = 0)).ravel();
+    else:
+        p = mat / total.astype(dtype);
+        logq = np.log(np.where(p==0, dtype(0.2333), p));
+        plogp = np.sum(p * np.where(p==0, 0, logq), axis = 0);
+        if method == 'JS':
+            del logq;
+    p_sum = np.asarray(p.sum(axis = 0)).ravel();
+    
+    def cross(a, b):
+        # sum(p_a log q_b) for all a in block 'a' and all b in block 'b'
+        c = p[:, a].T @ logq[:, b];
+        if is_sparse(c):
+            c = c.toarray() + np.log(0.2333) * p_sum[a].reshape(-1, 1);
+        return np.asarray(c);
+    
+    def entro(x):
+        xlogx = np.zeros(x.shape, dtype = dtype);
+        np.log(x, out = xlogx, where = x>0);
+        return -np.sum(x * xlogx, axis = -1);
+    
+    if k is None:
+        Result = np.zeros([n, n], dtype = dtype);
+    else:
+        kk = min(k, max(n-1, 1));
+        Result = (np.zeros([n, kk], dtype = int), np.zeros([n, kk], dtype = dtype));
+    
+    allCols = slice(0, n);
+    for blk in row_blocks(n, block_size):
+        if method == 'KL':
+            D = plogp[blk].reshape(-1, 1) - cross(blk, allCols);
+        elif method == 'SymKL':
+            D = plogp[blk].reshape(-1, 1) - cross(blk, allCols) + \
+                plogp.reshape(1, -1) - cross(allCols, blk).T;
+        else:
+            # JS(p, q) = H((p+q)/2) - (H(p) + H(q))/2, over blocks of pairs
+            pb = p[:, blk].T;
+            pb = pb.toarray() if is_sparse(pb) else np.asarray(pb);
+            D = np.empty([pb.shape[0], n], dtype = dtype);
+            step = max(1, int(2**22 // max(pb.shape[0] * p.shape[0], 1)));
+            for cols in row_blocks(n, step):
+                pc = p[:, cols].T;
+                pc = pc.toarray() if is_sparse(pc) else np.asarray(pc);
+                D[:, cols] = entro((pb[:, None, :] + pc[None, :, :])/2) - \
+                             (entro(pb)[:, None] + entro(pc)[None, :])/2;
+        
+        D = (D / ln_base).astype(dtype, copy = False);
+        rows = np.arange(blk.stop - blk.start);
+        D[rows, rows + blk.start] = 0;
+        
+        if k is None:
+            Result[blk] = D;
+        else:
+            (idx, val) = top_k(D, k, offset = blk.start, largest = False);
+            Result[0][blk] = idx;
+            Result[1][blk] = val;
+    
+    return Result;
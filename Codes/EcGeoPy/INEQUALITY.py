@@ -3,6 +3,8 @@
 
 
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from statistics import NormalDist
 
 
 
@@ -118,20 +120,40 @@ def herfindahl(mat:np.ndarray) -> float | np.ndarray:
 
 
 # Gini 
-def gini_One(mat:np.ndarray) -> float | np.ndarray:
+# Both versions sort the data once, and then go through the sorted data in
+# chunks of rows, so that the rank/Lorenz terms are accumulated in float64
+# without any temporary array of the full size (input can stay in float32).
+GINI_CHUNK = 2**20;
+
+def gini_One(mat:np.ndarray, overwrite_input:bool = False) -> float | np.ndarray:
     '''
     Generate the Gini index from "unweighted" data, i.e. each element is 
     about just one entry. 
     Accept 1d or 2d array. When 2d array is used, values in each column
     belongs to a country.
+    If 'overwrite_input' is True, 'mat' is sorted in place (along axis 0) 
+    instead of being copied.
     '''
     
     if mat.ndim > 2:
         raise ValueError("'mat' must be either 1-d or 2-d array, but currently its dimension is {}.".format(mat.ndim));
     
-    seq = mat.argsort(axis = 0).argsort(axis = 0) + 1;
-    n = len(mat);
-    G = 2.0 * np.sum(mat*seq, axis = 0) / ( n * mat.sum(axis = 0) ) - (n+1)/n;
+    if overwrite_input:
+        mat.sort(axis = 0);
+        mat_asc = mat;
+    else:
+        mat_asc = np.sort(mat, axis = 0);
+    
+    # G = 2 * sum(x_(i) * i) / (n * sum(x)) - (n+1)/n, with x_(i) ascending
+    n = len(mat_asc);
+    xi_sum = np.zeros(mat_asc.shape[1:]);
+    x_sum = np.zeros(mat_asc.shape[1:]);
+    for start in range(0, n, GINI_CHUNK):
+        chunk = mat_asc[start:start+GINI_CHUNK].astype(float);
+        rank = np.arange(start+1, start+1+len(chunk), dtype = float);
+        xi_sum += rank @ chunk;
+        x_sum += chunk.sum(axis = 0);
+    G = 2.0 * xi_sum / ( n * x_sum ) - (n+1)/n;
     
     return G;
 
@@ -156,26 +178,40 @@ def gini_byClass(mat:np.ndarray, class_size:np.ndarray) -> float | np.ndarray:
     if class_size.ndim == 1 and mat.ndim == 2:
         if len(class_size) != mat.shape[0]:
             raise ValueError("If 'class_size' is an 1-d array, it must have the same number of elements as the number of rows of 'mat'");
-        class_size = class_size.reshape(-1, 1).copy();
+        class_size = class_size.reshape(-1, 1);
     elif mat.shape!=class_size.shape:
         raise ValueError("When 'class_size' and 'mat' have the same dimensions, they must have the same shape. But currently the shape of 'mat' is {a} and the shape of 'class_size' is {b}.".format(a=mat.shape, b=class_size.shape));
     
     seq = mat.argsort(axis = 0);
-    mat_asc = np.take_along_axis(mat, seq, axis = 0);
-    cs_asc = np.take_along_axis(class_size, seq, axis = 0);
-    csh_asc = cs_asc/cs_asc.sum(axis = 0);
-    xfx = mat_asc*csh_asc;
-    cumSum_xfx = xfx.cumsum(axis = 0);
-    cumSum_xfx0 = np.insert(cumSum_xfx, 0, 0, axis = 0)[:-1];
-    G = 1 - np.sum(csh_asc * (cumSum_xfx0 + cumSum_xfx),
-                       axis = 0) / cumSum_xfx[-1];
+    cs_sum = class_size.sum(axis = 0, dtype = float);
+    
+    # G = 1 - sum(f_i * (L_(i-1) + L_i)) / L_n, with f_i the class share and
+    # L_i = cumsum(x * f) in the ascending order, i.e. L_(i-1) + L_i is
+    # 2 * L_i - x_i * f_i (no shifted copy of L needed).
+    n = len(mat);
+    carry = np.zeros(mat.shape[1:]);
+    lorenz = np.zeros(mat.shape[1:]);
+    for start in range(0, n, GINI_CHUNK):
+        idx = seq[start:start+GINI_CHUNK];
+        mat_asc = np.take_along_axis(mat, idx, axis = 0).astype(float);
+        if class_size.shape == mat.shape:
+            csh_asc = np.take_along_axis(class_size, idx, axis = 0) / cs_sum;
+        else:
+            csh_asc = class_size[:, 0][idx] / cs_sum;
+        xfx = mat_asc*csh_asc;
+        cumSum_xfx = xfx.cumsum(axis = 0) + carry;
+        lorenz += np.sum(csh_asc * (2*cumSum_xfx - xfx), axis = 0);
+        carry = cumSum_xfx[-1];
+    G = 1 - lorenz / carry;
     
     return G;
 
 
 
 
-def gini(mat:np.ndarray, class_size:np.ndarray | None = None) -> float | np.ndarray:
+def gini(mat:np.ndarray,
+         class_size:np.ndarray | None = None,
+         overwrite_input:bool = False) -> float | np.ndarray:
     '''
     Generate the Gini index.
     
@@ -191,12 +227,15 @@ def gini(mat:np.ndarray, class_size:np.ndarray | None = None) -> float | np.ndar
              If it is not supplied to the function, then it 
          treat each element in the 'mat' as equal in size (e.g. it can be then
          the income of each individual person). 
+    overwrite_input: bool. Only used when 'class_size' is not supplied. If 
+         True, 'mat' is sorted in place to save the memory of a sorted copy.
+         Default False.
     '''
     if mat.ndim > 2:
         raise ValueError("'mat' must be either 1-d or 2-d array, but currently its dimension is {}.".format(mat.ndim));
     
     if class_size is None:
-        return gini_One(mat);
+        return gini_One(mat, overwrite_input = overwrite_input);
     else:
         if class_size.ndim > 2:
             raise ValueError("'class_size' must be either 1-d or 2-d array, but currently its dimension is {}.".format(class_size.ndim));
@@ -457,3 +496,1065 @@ def theil(mat:np.ndarray,
     return THEIL;
 
 
+
+
+
+
+# Segmented (grouped) versions, for ragged data where each observation is
+# tagged with a group (e.g. individual incomes tagged with region codes).
+def check_grouped(values:np.ndarray,
+                  group_ids:np.ndarray,
+                  weights:np.ndarray | None = None):
+    '''
+    Validate the inputs of the grouped indices, and factorize the groups.
+    Returns (values, weights, unique_groups, inverse).
+    '''
+    values = np.asarray(values);
+    group_ids = np.asarray(group_ids);
+    if values.ndim != 1:
+        raise ValueError("'values' must be an 1-d array, but currently its dimension is {}.".format(values.ndim));
+    if group_ids.ndim != 1:
+        raise ValueError("'group_ids' must be an 1-d array, but currently its dimension is {}.".format(group_ids.ndim));
+    if len(values) != len(group_ids):
+        raise ValueError("'values' and 'group_ids' must have the same number of elements, but currently they have {a} and {b}.".format(a=len(values), b=len(group_ids)));
+    if weights is not None:
+        weights = np.asarray(weights);
+        if weights.ndim != 1:
+            raise ValueError("'weights' must be an 1-d array, but currently its dimension is {}.".format(weights.ndim));
+        if len(weights) != len(values):
+            raise ValueError("'weights' must have the same number of elements as 'values', but currently they have {a} and {b}.".format(a=len(weights), b=len(values)));
+    
+    (unique_groups, inverse) = np.unique(group_ids, return_inverse = True);
+    return (values, weights, unique_groups, inverse.ravel());
+
+
+
+def gini_grouped(values:np.ndarray,
+                 group_ids:np.ndarray,
+                 weights:np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray]:
+    '''
+    Generate the Gini index of every group, from one sort of the data by 
+    (group, value). Same as calling 'gini' on the values of each group.
+    
+    Parameters:
+    -----
+    values: numpy 1-d array, e.g. income of each individual.
+    group_ids: numpy 1-d array, the group (e.g. region) of each element of
+         'values'.
+    weights: numpy 1-d array. Optional. Same as 'class_size' in 'gini'.
+    
+    Returns
+    -----
+    (G, unique_groups): the Gini index of each group, and the sorted unique
+         groups.
+    '''
+    (values, weights, unique_groups, inverse) = check_grouped(values, group_ids, weights);
+    ng = len(unique_groups);
+    
+    # Sort by value, then stable sort by group (faster than np.lexsort)
+    seq = np.argsort(values);
+    seq = seq[np.argsort(inverse[seq], kind = 'stable')];
+    x = values[seq].astype(float);
+    seg = inverse[seq];
+    counts = np.bincount(seg, minlength = ng);
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]));
+    x_sum = np.bincount(seg, weights = x, minlength = ng);
+    
+    if weights is None:
+        # rank of each element within its group, 1-based
+        rank = np.arange(1, len(x)+1) - starts[seg];
+        n = counts.astype(float);
+        G = 2.0 * np.bincount(seg, weights = x*rank, minlength = ng) / (n * x_sum) - (n+1)/n;
+    else:
+        w = weights[seq].astype(float);
+        w_sum = np.bincount(seg, weights = w, minlength = ng);
+        csh = w / w_sum[seg];
+        xfx = x * csh;
+        cumSum_xfx = np.cumsum(xfx);
+        cumSum_xfx -= (cumSum_xfx[starts] - xfx[starts])[seg];
+        lorenz = np.bincount(seg, weights = csh * (2*cumSum_xfx - xfx), minlength = ng);
+        G = 1 - lorenz / np.bincount(seg, weights = xfx, minlength = ng);
+    
+    return (G, unique_groups);
+
+
+
+def theil_grouped(values:np.ndarray,
+                  group_ids:np.ndarray,
+                  weights:np.ndarray | None = None,
+                  method:str = 'L',
+                  base:str = 'e') -> tuple[np.ndarray, np.ndarray]:
+    '''
+    Generate the Theil index of every group, from segment sums of the values
+    and their logs (no sort needed). Same as calling 'theil' on the values of
+    each group.
+    
+    Parameters:
+    -----
+    values: numpy 1-d array, e.g. income of each individual.
+    group_ids: numpy 1-d array, the group (e.g. region) of each element of
+         'values'.
+    weights: numpy 1-d array. Optional. Same as 'class_size' in 'theil'.
+    method: "L" (default), "T" or "S", see 'theil'.
+    base: string. 'e' (default), '2' or '10'.
+    
+    Returns
+    -----
+    (THEIL, unique_groups): the Theil index of each group, and the sorted 
+         unique groups.
+    '''
+    allowed_methods = ['T','L','S'];
+    if method not in allowed_methods:
+        raise ValueError("'method' must be either of the following: '{}'.".format(
+            "', '".join(allowed_methods)));
+    allowed_bases = ['e', '2', '10', 2, 10];
+    if base not in allowed_bases:
+        raise ValueError("'base' must be either of the following: '{}'.".format(
+            "', '".join(allowed_bases[:3])));
+    (values, weights, unique_groups, inverse) = check_grouped(values, group_ids, weights);
+    ng = len(unique_groups);
+    
+    # Only positive values (and positive weights) enter the index
+    if weights is None:
+        isIncl = values > 0;
+        w = isIncl.astype(float);
+    else:
+        isIncl = (values > 0) & (weights > 0);
+        w = np.where(isIncl, weights, 0).astype(float);
+    x = np.where(isIncl, values, 1).astype(float);
+    logx = np.log(x);
+    
+    w_sum = np.bincount(inverse, weights = w, minlength = ng);
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        mu = np.bincount(inverse, weights = w*x, minlength = ng) / w_sum;
+        THEIL_L = np.log(mu) - np.bincount(inverse, weights = w*logx, minlength = ng) / w_sum;
+        THEIL_T = np.bincount(inverse, weights = w*x*logx, minlength = ng) / (w_sum*mu) - np.log(mu);
+    
+    if method == 'L':
+        THEIL = THEIL_L;
+    elif method == 'T':
+        THEIL = THEIL_T;
+    else:
+        THEIL = (THEIL_L + THEIL_T)/2.0;
+    
+    if base == '2' or base == 2:
+        THEIL = THEIL / np.log(2);
+    elif base == '10' or base == 10:
+        THEIL = THEIL / np.log(10);
+    
+    return (THEIL, unique_groups);
+
+
+
+def robin_hood_grouped(values:np.ndarray,
+                       group_ids:np.ndarray,
+                       weights:np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray]:
+    '''
+    Generate the Robin Hood index of every group, from segment sums (no sort
+    needed). Same as calling 'robin_hood' on the values of each group.
+    
+    Parameters:
+    -----
+    values: numpy 1-d array, e.g. income of each individual.
+    group_ids: numpy 1-d array, the group (e.g. region) of each element of
+         'values'.
+    weights: numpy 1-d array. Optional. Same as 'class_size' in 'robin_hood'.
+    
+    Returns
+    -----
+    (RH, unique_groups): the Robin Hood index of each group, and the sorted
+         unique groups.
+    '''
+    (values, weights, unique_groups, inverse) = check_grouped(values, group_ids, weights);
+    ng = len(unique_groups);
+    x = values.astype(float);
+    
+    if weights is None:
+        n = np.bincount(inverse, minlength = ng);
+        x_sum = np.bincount(inverse, weights = x, minlength = ng);
+        x_mean = x_sum / n;
+        RH = 0.5 * np.bincount(inverse, weights = np.abs(x - x_mean[inverse]), minlength = ng) / x_sum;
+    else:
+        w = weights.astype(float);
+        fairplay = w / np.bincount(inverse, weights = w, minlength = ng)[inverse];
+        incomes = x * w;
+        realdist = incomes / np.bincount(inverse, weights = incomes, minlength = ng)[inverse];
+        RH = 0.5 * np.bincount(inverse, weights = np.abs(fairplay - realdist), minlength = ng);
+    
+    return (RH, unique_groups);
+
+
+
+
+def herfindahl_grouped(sales:np.ndarray,
+                       market_id:np.ndarray,
+                       top_k:tuple = (4,)) -> tuple[np.ndarray, np.ndarray]:
+    '''
+    Generate the Herfindahl-Hirschman index, the equivalent number of firms 
+    (1 / HHI) and the top-k concentration ratios of every market, from 
+    segment sums of the sales and squared sales. Same as calling 'herfindahl'
+    on the sales of each market.
+    
+    Parameters:
+    -----
+    sales: numpy 1-d array, e.g. sales of each firm.
+    market_id: numpy 1-d array, the market (e.g. industry x region) of each
+         element of 'sales'.
+    top_k: tuple of integers. The concentration ratio CR_k (share of the k 
+         largest firms) is given for each k. Default (4,). The data is sorted
+         by (market, sales) once for all of them; with an empty tuple no sort
+         is needed.
+    
+    Returns
+    -----
+    (HHI, unique_markets): 
+         HHI: numpy structured array, one record per market, with the fields
+              'hhi', 'n_equiv', 'n_firms', and 'cr<k>' for each k in 'top_k'
+              (e.g. 'cr4').
+         unique_markets: the sorted unique markets.
+    '''
+    top_k = tuple(int(k) for k in top_k);
+    if any(k < 1 for k in top_k):
+        raise ValueError("'top_k' must contain positive integers only, but currently it is {}.".format(top_k));
+    (sales, weights, unique_markets, inverse) = check_grouped(sales, market_id);
+    nm = len(unique_markets);
+    x = sales.astype(float);
+    
+    fields = [('hhi', float), ('n_equiv', float), ('n_firms', np.int64)] + \
+             [('cr{}'.format(k), float) for k in top_k];
+    HHI = np.zeros(nm, dtype = fields);
+    
+    x_sum = np.bincount(inverse, weights = x, minlength = nm);
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        HHI['hhi'] = np.bincount(inverse, weights = x*x, minlength = nm) / (x_sum*x_sum);
+        HHI['n_equiv'] = 1.0 / HHI['hhi'];
+    HHI['n_firms'] = np.bincount(inverse, minlength = nm);
+    
+    if len(top_k) > 0:
+        # Sort by sales (descending), then stable sort by market
+        seq = np.argsort(-x);
+        seq = seq[np.argsort(inverse[seq], kind = 'stable')];
+        seg = inverse[seq];
+        starts = np.concatenate(([0], np.cumsum(HHI['n_firms'])[:-1]));
+        rank = np.arange(len(x)) - starts[seg];
+        x = x[seq];
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            for k in top_k:
+                isTop = rank < k;
+                HHI['cr{}'.format(k)] = np.bincount(seg[isTop], weights = x[isTop], minlength = nm) / x_sum;
+    
+    return (HHI, unique_markets);
+
+
+
+# Mergeable sketch of a distribution, for data too large to be sorted at once
+class InequalitySketch:
+    '''
+    Approximate Gini and Robin Hood indices, and exact Theil indices, of a 
+    non-negative distribution that is given in chunks (e.g. partitions of 
+    national microdata), without a global sort.
+    
+    Values are put into log-spaced bins [a, a*(1+eps)), starting from 
+    'min_value'; values below 'min_value' (including zeros) share one bin.
+    Each bin keeps its total weight and total value, so that the bin means
+    preserve the overall mean. The Theil indices only need sums of the values
+    and their logs, and are kept exactly.
+    
+    Sketches built on different chunks (e.g. in different processes) with the
+    same 'eps' and 'min_value' can be merged.
+    
+    Parameters
+    -----
+    eps: float. Relative width of the bins. The error of the Gini index is at
+         most about 'eps' (see 'gini'). Default 0.01.
+    min_value: float. Lower end of the first log-spaced bin. Default 1e-6.
+    '''
+    
+    def __init__(self, eps:float = 0.01, min_value:float = 1e-6):
+        if eps <= 0:
+            raise ValueError("'eps' must be positive, but currently it is {}.".format(eps));
+        if min_value <= 0:
+            raise ValueError("'min_value' must be positive, but currently it is {}.".format(min_value));
+        self.eps = eps;
+        self.min_value = min_value;
+        self.keys = np.zeros(0, dtype = np.int64);
+        self.counts = np.zeros(0);
+        self.sums = np.zeros(0);
+        # Sums over the positive values (and positive weights), for Theil
+        self.w_pos = 0.0;
+        self.wx_pos = 0.0;
+        self.wlogx_pos = 0.0;
+        self.wxlogx_pos = 0.0;
+    
+    
+    def add_bins(self, keys:np.ndarray, counts:np.ndarray, sums:np.ndarray):
+        keys = np.concatenate((self.keys, keys));
+        (self.keys, inverse) = np.unique(keys, return_inverse = True);
+        inverse = inverse.ravel();
+        self.counts = np.bincount(inverse, weights = np.concatenate((self.counts, counts)), minlength = len(self.keys));
+        self.sums = np.bincount(inverse, weights = np.concatenate((self.sums, sums)), minlength = len(self.keys));
+    
+    
+    def update(self, values:np.ndarray, weights:np.ndarray | None = None):
+        '''
+        Add a chunk of data.
+        
+        values: numpy 1-d array of non-negative values, e.g. incomes.
+        weights: numpy 1-d array. Optional. Same as 'class_size' in 'gini'.
+        '''
+        values = np.asarray(values, dtype = float).ravel();
+        if weights is None:
+            weights = np.ones(len(values));
+        else:
+            weights = np.asarray(weights, dtype = float).ravel();
+            if len(weights) != len(values):
+                raise ValueError("'weights' must have the same number of elements as 'values', but currently they have {a} and {b}.".format(a=len(weights), b=len(values)));
+            if len(weights) > 0 and weights.min() < 0:
+                raise ValueError("'weights' must not be negative.");
+        if len(values) == 0:
+            return self;
+        if values.min() < 0:
+            raise ValueError("'values' must not be negative.");
+        
+        isLow = values < self.min_value;
+        keys = np.full(len(values), -1, dtype = np.int64);
+        keys[~isLow] = np.floor(np.log(values[~isLow]/self.min_value) / np.log1p(self.eps)).astype(np.int64);
+        (ukeys, inverse) = np.unique(keys, return_inverse = True);
+        inverse = inverse.ravel();
+        self.add_bins(ukeys,
+                      np.bincount(inverse, weights = weights, minlength = len(ukeys)),
+                      np.bincount(inverse, weights = weights*values, minlength = len(ukeys)));
+        
+        isPos = (values > 0) & (weights > 0);
+        w = weights[isPos];
+        x = values[isPos];
+        logx = np.log(x);
+        self.w_pos += w.sum();
+        self.wx_pos += (w*x).sum();
+        self.wlogx_pos += (w*logx).sum();
+        self.wxlogx_pos += (w*x*logx).sum();
+        return self;
+    
+    
+    def merge(self, other:'InequalitySketch'):
+        '''
+        Add the data of another sketch, built with the same 'eps' and 
+        'min_value'.
+        '''
+        if other.eps != self.eps or other.min_value != self.min_value:
+            raise ValueError("Only sketches with the same 'eps' and 'min_value' can be merged.");
+        self.add_bins(other.keys, other.counts, other.sums);
+        self.w_pos += other.w_pos;
+        self.wx_pos += other.wx_pos;
+        self.wlogx_pos += other.wlogx_pos;
+        self.wxlogx_pos += other.wxlogx_pos;
+        return self;
+    
+    
+    def bins(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        '''
+        (keys, weight, mean value) of the non-empty bins, ascending.
+        '''
+        isUsed = self.counts > 0;
+        return (self.keys[isUsed], self.counts[isUsed], self.sums[isUsed]/self.counts[isUsed]);
+    
+    
+    def spread(self) -> np.ndarray:
+        '''
+        Upper bound of sum(w * |x - bin mean|) within each non-empty bin.
+        '''
+        (keys, counts, means) = self.bins();
+        return np.where(keys < 0, counts * self.min_value, self.eps * counts * means);
+    
+    
+    def gini(self) -> tuple[float, float]:
+        '''
+        Return (G, bound): the Gini index of the bin means weighted by the bin
+        sizes, and the bound of |G - exact Gini|. Since the Gini index is half
+        the mean absolute difference over the mean, moving every value to its
+        bin mean changes it by at most sum(w * |x - bin mean|) / sum(w * x),
+        i.e. at most 'eps' plus the share of the bin below 'min_value'.
+        '''
+        (keys, counts, means) = self.bins();
+        total = np.sum(counts * means);
+        G = gini_byClass(means, counts);
+        return (float(G), float(np.sum(self.spread()) / total));
+    
+    
+    def robin_hood(self) -> tuple[float, float]:
+        '''
+        Return (RH, bound): the Robin Hood index of the bin means weighted by
+        the bin sizes, and the bound of |RH - exact Robin Hood index|. Only
+        the bin that contains the mean contributes to the error.
+        '''
+        (keys, counts, means) = self.bins();
+        RH = rh_byClass(means, counts);
+        mu = np.sum(counts * means) / np.sum(counts);
+        k = np.floor(np.log(mu/self.min_value) / np.log1p(self.eps)) if mu >= self.min_value else -1;
+        bound = 0.5 * np.sum(self.spread()[keys == k]) / np.sum(counts * means);
+        return (float(RH), float(bound));
+    
+    
+    def theil(self, method:str = 'L', base:str = 'e') -> tuple[float, float]:
+        '''
+        Return (THEIL, bound). The Theil index is computed from exact sums of
+        the positive values and their logs, so that the bound is 0 (apart 
+        from floating point rounding).
+        
+        'method' must be one of "L" (default), "T" or "S", see 'theil'.
+        '''
+        allowed_methods = ['T','L','S'];
+        if method not in allowed_methods:
+            raise ValueError("'method' must be either of the following: '{}'.".format(
+                "', '".join(allowed_methods)));
+        allowed_bases = ['e', '2', '10', 2, 10];
+        if base not in allowed_bases:
+            raise ValueError("'base' must be either of the following: '{}'.".format(
+                "', '".join(allowed_bases[:3])));
+        
+        mu = self.wx_pos / self.w_pos;
+        THEIL_L = np.log(mu) - self.wlogx_pos / self.w_pos;
+        THEIL_T = self.wxlogx_pos / self.wx_pos - np.log(mu);
+        if method == 'L':
+            THEIL = THEIL_L;
+        elif method == 'T':
+            THEIL = THEIL_T;
+        else:
+            THEIL = (THEIL_L + THEIL_T)/2.0;
+        
+        if base == '2' or base == 2:
+            THEIL = THEIL / np.log(2);
+        elif base == '10' or base == 10:
+            THEIL = THEIL / np.log(10);
+        return (float(THEIL), 0.0);
+
+
+
+
+def theil_decomposition(values:np.ndarray,
+                        groups:list,
+                        weights:np.ndarray | None = None,
+                        method:str = 'L',
+                        base:str = 'e') -> dict:
+    '''
+    Decompose the Theil index into between-group and within-group components
+    at every level of a nested grouping (e.g. county -> state, with the 
+    nation as the whole data), from one pass of segment sums.
+    
+    For each level:
+        total = between + within
+    where 'between' is the Theil index of the group means weighted by the 
+    group sizes (i.e. 'theil_byClass_L'/'theil_byClass_T' applied to the
+    groups), and 'within' is the average of the Theil index in each group,
+    weighted by the population share ("L") or the income share ("T").
+    
+    Parameters:
+    -----
+    values: numpy 1-d array, e.g. income of each individual.
+    groups: list of numpy 1-d arrays, one per level from the finest to the 
+         coarsest, each with the same number of elements as 'values'. Each
+         group must be nested in a single group of the next level.
+    weights: numpy 1-d array. Optional. Same as 'class_size' in 'theil'.
+    method: "L" (default) or "T". ("S" is not additively decomposable.)
+    base: string. 'e' (default), '2' or '10'.
+    
+    Returns
+    -----
+    dict with:
+        'total':   the Theil index of all data (a float).
+        'between': numpy array, between-group component at each level.
+        'within':  numpy array, within-group component at each level.
+        'group_index': list of numpy arrays, the Theil index of each group
+                       at each level.
+        'groups':  list of numpy arrays, the sorted unique groups at each
+                   level.
+    As in 'theil', only positive values (with positive weights) are used.
+    '''
+    allowed_methods = ['T','L'];
+    if method not in allowed_methods:
+        raise ValueError("'method' must be either of the following: '{}'.".format(
+            "', '".join(allowed_methods)));
+    allowed_bases = ['e', '2', '10', 2, 10];
+    if base not in allowed_bases:
+        raise ValueError("'base' must be either of the following: '{}'.".format(
+            "', '".join(allowed_bases[:3])));
+    if len(groups) == 0:
+        raise ValueError("'groups' must contain at least one level.");
+    
+    (values, weights, fine_groups, fine) = check_grouped(values, groups[0], weights);
+    nf = len(fine_groups);
+    
+    # Nesting: map each finest group to its group at each level
+    # (each level is checked against the previous one, so that every group
+    # sits in a single group of the next level)
+    levels = [(fine_groups, np.arange(nf))];
+    (prev_inverse, prev_n) = (fine, nf);
+    for (i, g) in enumerate(groups[1:]):
+        (values, weights, unique_groups, inverse) = check_grouped(values, g, weights);
+        if len(np.unique(prev_inverse * len(unique_groups) + inverse)) != prev_n:
+            raise ValueError("The groups must be nested, but some groups of level {a} belong to several groups of level {b}.".format(a=i, b=i+1));
+        pairs = np.unique(fine * len(unique_groups) + inverse);
+        levels.append((unique_groups, pairs % len(unique_groups)));
+        (prev_inverse, prev_n) = (inverse, len(unique_groups));
+    
+    # One pass: segment sums over the finest groups
+    if weights is None:
+        isIncl = values > 0;
+        w = isIncl.astype(float);
+    else:
+        isIncl = (values > 0) & (weights > 0);
+        w = np.where(isIncl, weights, 0).astype(float);
+    x = np.where(isIncl, values, 1).astype(float);
+    logx = np.log(x);
+    sums = np.asarray([np.bincount(fine, weights = w, minlength = nf),
+                       np.bincount(fine, weights = w*x, minlength = nf),
+                       np.bincount(fine, weights = w*logx, minlength = nf),
+                       np.bincount(fine, weights = w*x*logx, minlength = nf)]);
+    
+    def index_of(s):
+        # Theil index from the sums (w, wx, wlogx, wxlogx)
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            mu = s[1] / s[0];
+            if method == 'L':
+                return np.log(mu) - s[2] / s[0];
+            else:
+                return s[3] / s[1] - np.log(mu);
+    
+    total_sums = sums.sum(axis = 1);
+    THEIL = index_of(total_sums);
+    between = [];
+    within = [];
+    group_index = [];
+    for (unique_groups, to_level) in levels:
+        s = np.asarray([np.bincount(to_level, weights = x, minlength = len(unique_groups)) for x in sums]);
+        isUsed = s[0] > 0;
+        mu = np.where(isUsed, s[1], 0) / np.where(isUsed, s[0], 1);
+        if method == 'L':
+            between.append(theil_byClass_L(mu, s[0]));
+            share = s[0] / total_sums[0];
+        else:
+            between.append(theil_byClass_T(mu, s[0]));
+            share = s[1] / total_sums[1];
+        idx = index_of(s);
+        within.append(np.sum(np.where(isUsed, share * idx, 0)));
+        group_index.append(idx);
+    
+    ln_base = {'e': 1.0, '2': np.log(2), 2: np.log(2), '10': np.log(10), 10: np.log(10)}[base];
+    return {'total': float(THEIL / ln_base),
+            'between': np.asarray(between) / ln_base,
+            'within': np.asarray(within) / ln_base,
+            'group_index': [x / ln_base for x in group_index],
+            'groups': [x[0] for x in levels]};
+
+
+
+
+# All indices at once
+REPORT_DTYPE = np.dtype([('gini', float),
+                         ('theil_L', float),
+                         ('theil_T', float),
+                         ('theil_S', float),
+                         ('robin_hood', float),
+                         ('herfindahl', float)]);
+
+def inequality_report(mat:np.ndarray,
+                      class_size:np.ndarray | None = None,
+                      base:str = 'e') -> np.ndarray:
+    '''
+    Generate the Gini, Theil (L, T and S), Robin Hood and Herfindahl indices
+    at once, with one validation, one sort, one pass of logs and one set of
+    reductions per column. Each index is the same as calling the respective
+    function ('gini', 'theil', 'robin_hood', 'herfindahl') separately, except
+    for the base of the Theil indices: 'base' is always applied here, while
+    'theil' without 'class_size' ignores it and uses natural logs. With the
+    default base 'e' (or with 'class_size'), the two agree.
+
+    Parameters:
+    -----
+    mat: numpy array, either 1 or 2 dimensions.
+         When input a two-dimensional array, each column is for data 
+         in a same region.
+    class_size: how large is the group with such income. Optional, see 
+         'gini'. The Herfindahl index then treats each class as 'class_size'
+         firms of the same size.
+    base: string. Base of the logs in the Theil indices. 'e' (default), '2' 
+         or '10'.
+    
+    Returns
+    -----
+    numpy structured array with the fields 'gini', 'theil_L', 'theil_T', 
+    'theil_S', 'robin_hood' and 'herfindahl': one record per column of a 2-d 
+    'mat', or a single record for an 1-d 'mat'.
+    '''
+    allowed_bases = ['e', '2', '10', 2, 10];
+    if base not in allowed_bases:
+        raise ValueError("'base' must be either of the following: '{}'.".format(
+            "', '".join(allowed_bases[:3])));
+    if mat.ndim > 2:
+        raise ValueError("'mat' must be either 1-d or 2-d array, but currently its dimension is {}.".format(mat.ndim));
+    if class_size is not None:
+        if class_size.ndim > 2:
+            raise ValueError("'class_size' must be either 1-d or 2-d array, but currently its dimension is {}.".format(class_size.ndim));
+        if class_size.ndim == 1 and mat.ndim == 2:
+            if len(class_size) != mat.shape[0]:
+                raise ValueError("If 'class_size' is an 1-d array, it must have the same number of elements as the number of rows of 'mat'");
+            class_size = class_size.reshape(-1, 1);
+        elif mat.shape!=class_size.shape:
+            raise ValueError("When 'class_size' and 'mat' have the same dimensions, they must have the same shape. But currently the shape of 'mat' is {a} and the shape of 'class_size' is {b}.".format(a=mat.shape, b=class_size.shape));
+    
+    isOne = mat.ndim == 1;
+    if isOne:
+        mat = mat.reshape(-1, 1);
+        if class_size is not None:
+            class_size = class_size.reshape(-1, 1);
+    n = mat.shape[0];
+    
+    # One sort
+    if class_size is None:
+        x = np.sort(mat, axis = 0).astype(float, copy = False);
+        w = None;
+    else:
+        seq = mat.argsort(axis = 0);
+        x = np.take_along_axis(mat, seq, axis = 0).astype(float);
+        if class_size.shape == mat.shape:
+            w = np.take_along_axis(class_size, seq, axis = 0).astype(float);
+        else:
+            w = class_size[:, 0][seq].astype(float);
+        del seq;
+    
+    # One pass of logs, over the positive values
+    isPos = x > 0 if w is None else (x > 0) & (w > 0);
+    logx = np.zeros(x.shape);
+    np.log(x, out = logx, where = isPos);
+    
+    # One set of reductions
+    if w is None:
+        x_sum = x.sum(axis = 0);
+        x_mean = x_sum / n;
+        rank = np.arange(1, n+1, dtype = float);
+        G = 2.0 * (rank @ x) / ( n * x_sum ) - (n+1)/n;
+        RH = 0.5 * np.sum(np.abs(x - x_mean), axis = 0) / x_sum;
+        HFD = np.sum(x*x, axis = 0) / (x_sum*x_sum);
+        w_pos = isPos.sum(axis = 0);
+        wx_pos = np.sum(np.where(isPos, x, 0), axis = 0);
+        wlogx_pos = logx.sum(axis = 0);
+        wxlogx_pos = np.sum(x*logx, axis = 0);
+    else:
+        w_sum = w.sum(axis = 0);
+        wx = w*x;
+        wx_sum = wx.sum(axis = 0);
+        csh = w / w_sum;
+        xfx = x * csh;
+        cumSum_xfx = xfx.cumsum(axis = 0);
+        G = 1 - np.sum(csh * (2*cumSum_xfx - xfx), axis = 0) / cumSum_xfx[-1];
+        del cumSum_xfx, xfx;
+        RH = 0.5 * np.sum(np.abs(csh - wx/wx_sum), axis = 0);
+        HFD = np.sum(wx*x, axis = 0) / (wx_sum*wx_sum);
+        w_pos = np.sum(np.where(isPos, w, 0), axis = 0);
+        wx_pos = np.sum(np.where(isPos, wx, 0), axis = 0);
+        wlogx_pos = np.sum(w*logx, axis = 0);
+        wxlogx_pos = np.sum(wx*logx, axis = 0);
+    
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        mu = wx_pos / w_pos;
+        THEIL_L = np.log(mu) - wlogx_pos / w_pos;
+        THEIL_T = wxlogx_pos / (w_pos * mu) - np.log(mu);
+    ln_base = {'e': 1.0, '2': np.log(2), 2: np.log(2), '10': np.log(10), 10: np.log(10)}[base];
+    THEIL_L = THEIL_L / ln_base;
+    THEIL_T = THEIL_T / ln_base;
+    
+    report = np.empty(mat.shape[1], dtype = REPORT_DTYPE);
+    report['gini'] = G;
+    report['theil_L'] = THEIL_L;
+    report['theil_T'] = THEIL_T;
+    report['theil_S'] = (THEIL_L + THEIL_T)/2.0;
+    report['robin_hood'] = RH;
+    report['herfindahl'] = HFD;
+    
+    return report[0] if isOne else report;
+
+
+
+
+# Bootstrap confidence intervals
+def index_sorted(values:np.ndarray,
+                 W:np.ndarray,
+                 index:str,
+                 base:str = 'e') -> np.ndarray:
+    '''
+    Evaluate one of the indices accepted by 'bootstrap_ci' for ascending 
+    'values' and a 2-d array of weights 'W' (one column per replicate), i.e.
+    the same as the 'class_size' paths with 'class_size' = W, but without 
+    sorting each column: with the values shared and sorted, the Lorenz and
+    Theil terms are cumulative sums of the weights and matrix products.
+    '''
+    if index == 'gini':
+        # sum_ij w_i w_j |x_i - x_j| = 2 sum_i w_i x_i (F_(i-1) + F_i - W)
+        F = np.cumsum(W, axis = 0);
+        W_sum = F[-1];
+        G = (values @ (W * (2*F - W - W_sum))) / (W_sum * (values @ W));
+        return G;
+    elif index == 'robin_hood':
+        wx_sum = values @ W;
+        mu = wx_sum / W.sum(axis = 0);
+        return 0.5 * np.sum(W * np.abs(values.reshape(-1, 1) - mu), axis = 0) / wx_sum;
+    else:
+        isPos = (values > 0).astype(float);
+        x = np.where(isPos > 0, values, 1);
+        logx = np.log(x);
+        (w_pos, wx_pos, wlogx_pos, wxlogx_pos) = np.asarray([isPos, isPos*x, isPos*logx, isPos*x*logx]) @ W;
+        mu = wx_pos / w_pos;
+        THEIL_L = np.log(mu) - wlogx_pos / w_pos;
+        THEIL_T = wxlogx_pos / wx_pos - np.log(mu);
+        if index == 'theil_L':
+            THEIL = THEIL_L;
+        elif index == 'theil_T':
+            THEIL = THEIL_T;
+        else:
+            THEIL = (THEIL_L + THEIL_T)/2.0;
+        ln_base = {'e': 1.0, '2': np.log(2), 2: np.log(2), '10': np.log(10), 10: np.log(10)}[base];
+        return THEIL / ln_base;
+
+
+
+def bootstrap_block(values:np.ndarray,
+                    class_size:np.ndarray,
+                    index:str,
+                    base:str,
+                    n_rep:int,
+                    block_size:int,
+                    seed:np.random.SeedSequence) -> np.ndarray:
+    '''
+    Evaluate 'n_rep' bootstrap replicates, as 2-d blocks of 'block_size'
+    replicate weights (columns). Run in the worker processes of 'bootstrap_ci'.
+    '''
+    rng = np.random.default_rng(seed);
+    n = len(values);
+    out = [];
+    for start in range(0, n_rep, block_size):
+        b = min(block_size, n_rep - start);
+        # Multinomial(n, 1/n) counts of each replicate, as a column
+        draws = rng.integers(0, n, size = (b, n)) + n*np.arange(b).reshape(-1, 1);
+        counts = np.bincount(draws.ravel(), minlength = b*n).reshape(b, n).T;
+        out.append(index_sorted(values, counts * class_size.reshape(-1, 1), index, base));
+    return np.concatenate(out);
+
+
+
+def bootstrap_ci(values:np.ndarray,
+                 class_size:np.ndarray | None = None,
+                 index:str = 'gini',
+                 n_boot:int = 1000,
+                 level:float = 0.95,
+                 interval:str = 'percentile',
+                 base:str = 'e',
+                 block_size:int = 64,
+                 n_jobs:int = 1,
+                 seed:int | None = None) -> dict:
+    '''
+    Bootstrap confidence interval of an inequality index.
+    
+    Each replicate resamples the observations with replacement, which is the 
+    same as weighting them by multinomial counts. The counts are used as the
+    'class_size' of the index, so that a block of replicates is a single 2-d
+    evaluation (one column per replicate). As all replicates share the same
+    values, these are sorted once, and the blocks are evaluated with 
+    cumulative sums and matrix products (see 'index_sorted'). Blocks are spread over 'n_jobs' 
+    processes; each block has its own random stream spawned from 'seed', so
+    the result does not depend on 'n_jobs'.
+    
+    Parameters:
+    -----
+    values: numpy 1-d array, e.g. income of each individual.
+    class_size: numpy 1-d array. Optional, see 'gini'. When supplied, each 
+         observation keeps its class size, multiplied by its bootstrap count.
+    index: String, the index, must be one of "gini" (default), "theil_L", 
+         "theil_T", "theil_S" or "robin_hood".
+    n_boot: integer. Number of bootstrap replicates. Default 1000.
+    level: float. Confidence level. Default 0.95.
+    interval: String, must be one of:
+         * "percentile" => percentile interval (default)
+         - "BCa" => bias-corrected and accelerated interval. The acceleration
+           is estimated with a delete-group jackknife over at most 200 groups
+           of observations.
+    base: string. Base of the logs in the Theil indices. 'e' (default), '2' 
+         or '10'.
+    block_size: integer. Number of replicates evaluated together. Default 64.
+    n_jobs: integer. Number of processes. Default 1 (no process pool).
+    seed: integer. Optional. Seed of the random numbers.
+    
+    Returns
+    -----
+    dict with 'estimate', 'lower', 'upper', 'se' (bootstrap standard error)
+    and 'replicates'.
+    '''
+    allowed_indices = ['gini', 'theil_L', 'theil_T', 'theil_S', 'robin_hood'];
+    if index not in allowed_indices:
+        raise ValueError("'index' must be either of the following: '{}'.".format(
+            "', '".join(allowed_indices)));
+    allowed_intervals = ['percentile', 'BCa'];
+    if interval not in allowed_intervals:
+        raise ValueError("'interval' must be either of the following: '{}'.".format(
+            "', '".join(allowed_intervals)));
+    allowed_bases = ['e', '2', '10', 2, 10];
+    if base not in allowed_bases:
+        raise ValueError("'base' must be either of the following: '{}'.".format(
+            "', '".join(allowed_bases[:3])));
+    if not 0 < level < 1:
+        raise ValueError("'level' must be between 0 and 1, but currently it is {}.".format(level));
+    if n_boot < 2:
+        raise ValueError("'n_boot' must be at least 2, but currently it is {}.".format(n_boot));
+    
+    values = np.asarray(values);
+    if values.ndim != 1:
+        raise ValueError("'values' must be an 1-d array, but currently its dimension is {}.".format(values.ndim));
+    if class_size is None:
+        class_size = np.ones(len(values));
+    else:
+        class_size = np.asarray(class_size);
+        if class_size.shape != values.shape:
+            raise ValueError("'class_size' must have the same shape as 'values', but currently their shapes are {a} and {b}.".format(a=class_size.shape, b=values.shape));
+    
+    seq = np.argsort(values);
+    values = values[seq];
+    class_size = class_size[seq];
+    estimate = float(index_sorted(values, class_size.reshape(-1, 1), index, base)[0]);
+    
+    # Blocks of replicates, with reproducible random streams
+    n_blocks = -(-n_boot // block_size);
+    seeds = np.random.SeedSequence(seed).spawn(n_blocks);
+    reps = [min(block_size, n_boot - i*block_size) for i in range(n_blocks)];
+    args = [(values, class_size, index, base, reps[i], block_size, seeds[i]) for i in range(n_blocks)];
+    if n_jobs > 1:
+        with ProcessPoolExecutor(max_workers = n_jobs) as pool:
+            replicates = list(pool.map(bootstrap_block, *zip(*args)));
+    else:
+        replicates = [bootstrap_block(*x) for x in args];
+    replicates = np.concatenate(replicates);
+    
+    alpha = (1 - level)/2;
+    if interval == 'percentile':
+        (lower, upper) = np.quantile(replicates, [alpha, 1 - alpha]);
+    else:
+        # Bias correction
+        nd = NormalDist();
+        prop = np.mean(replicates < estimate);
+        prop = min(max(prop, 0.5/n_boot), 1 - 0.5/n_boot);
+        z0 = nd.inv_cdf(prop);
+        
+        # Acceleration, from a delete-group jackknife (one column per group)
+        n = len(values);
+        n_groups = min(n, 200);
+        group = np.random.default_rng(seeds[0].spawn(1)[0]).permutation(n) % n_groups;
+        jack = [];
+        for start in range(0, n_groups, block_size):
+            g = np.arange(start, min(start + block_size, n_groups));
+            keep = (group.reshape(-1, 1) != g.reshape(1, -1)).astype(float);
+            jack.append(index_sorted(values, keep * class_size.reshape(-1, 1), index, base));
+        jack = np.concatenate(jack);
+        d = jack.mean() - jack;
+        den = 6 * np.sum(d**2)**1.5;
+        a = np.sum(d**3) / den if den > 0 else 0.0;
+        
+        bounds = [];
+        for q in [alpha, 1 - alpha]:
+            zq = nd.inv_cdf(q);
+            bounds.append(nd.cdf(z0 + (z0 + zq)/(1 - a*(z0 + zq))));
+        (lower, upper) = np.quantile(replicates, bounds);
+    
+    return {'estimate': estimate,
+            'lower': float(lower),
+            'upper': float(upper),
+            'se': float(np.std(replicates, ddof = 1)),
+            'replicates': replicates};
+
+
+
+
+# Rolling-window (incremental) inequality
+class RollingInequality:
+    '''
+    Inequality indices of a multiset of observations that changes by adding
+    and removing batches of observations (e.g. a sliding window of years), 
+    updated incrementally instead of recomputed.
+    
+    Sums, sums of squares and sums of logs are updated directly. The rank 
+    term of the Gini index, sum(x_(i) * i), and the absolute deviations of 
+    the Robin Hood index need order statistics, which come from Fenwick trees
+    of counts and sums over the possible values. Adding or removing a batch 
+    of k observations among n costs O(k log n).
+    
+    Parameters
+    -----
+    support: numpy array of all the values that may ever be added (e.g. the 
+         whole panel). Only these values can be added.
+    '''
+    
+    def __init__(self, support:np.ndarray):
+        support = np.asarray(support, dtype = float).ravel();
+        self.levels = np.unique(support[np.isfinite(support)]);
+        # Fenwick trees of the count and sum per value, padded to a power of 2 so 
+        # that every update takes the same number of steps
+        self.depth = int(len(self.levels)).bit_length();
+        self.tree_count = np.zeros(2**self.depth + 1);
+        self.tree_sum = np.zeros(2**self.depth + 1);
+        self.n = 0;
+        self.x_sum = 0.0;
+        self.x2_sum = 0.0;
+        self.rank_sum = 0.0;
+        self.n_pos = 0;
+        self.pos_sum = 0.0;
+        self.logx_sum = 0.0;
+        self.xlogx_sum = 0.0;
+    
+    
+    def tree_update(self, i:np.ndarray, values:np.ndarray, sign:int):
+        (count, values) = (np.full(len(i), float(sign)), sign * values);
+        for _ in range(self.depth + 1):
+            np.add.at(self.tree_count, i, count);
+            np.add.at(self.tree_sum, i, values);
+            i = i + (i & -i);
+            isIn = i < len(self.tree_count);
+            if not isIn.all():
+                (i, count, values) = (i[isIn], count[isIn], values[isIn]);
+    
+    
+    def tree_query(self, i:np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        # count and sum of the first i values; position 0 of the trees stays 0
+        (count, total) = (self.tree_count[i], self.tree_sum[i]);
+        for _ in range(self.depth - 1):
+            i = i & (i - 1);
+            count += self.tree_count[i];
+            total += self.tree_sum[i];
+        return (count, total);
+    
+    
+    def cross_term(self, values:np.ndarray) -> float:
+        # sum over a in the multiset and b in 'values' of max(a, b)
+        (count_le, sum_le) = self.tree_query(np.searchsorted(self.levels, values, side = 'right'));
+        return float(np.dot(values, count_le) + len(values)*self.x_sum - sum_le.sum());
+    
+    
+    def check(self, values:np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        values = np.sort(np.asarray(values, dtype = float).ravel());
+        values = values[np.isfinite(values)];
+        pos = np.searchsorted(self.levels, values);
+        if np.any(pos >= len(self.levels)) or np.any(self.levels[np.minimum(pos, len(self.levels)-1)] != values):
+            raise ValueError("'values' must be part of the 'support' given when creating the object.");
+        return (values, pos + 1);
+    
+    
+    def batch_terms(self, values:np.ndarray, sign:int):
+        self.n += sign * len(values);
+        self.x_sum += sign * values.sum();
+        self.x2_sum += sign * np.dot(values, values);
+        pos = values[values > 0];
+        logx = np.log(pos);
+        self.n_pos += sign * len(pos);
+        self.pos_sum += sign * pos.sum();
+        self.logx_sum += sign * logx.sum();
+        self.xlogx_sum += sign * np.dot(pos, logx);
+    
+    
+    def add(self, values:np.ndarray):
+        '''
+        Add a batch of observations (NaN are ignored).
+        '''
+        (values, idx) = self.check(values);
+        # sum(x_(i) * i) of the union = both parts plus sum of max(a, b) over
+        # the pairs across the parts
+        self.rank_sum += np.dot(values, np.arange(1, len(values)+1)) + self.cross_term(values);
+        self.tree_update(idx, values, 1);
+        self.batch_terms(values, 1);
+        return self;
+    
+    
+    def remove(self, values:np.ndarray):
+        '''
+        Remove a batch of observations previously added (NaN are ignored).
+        '''
+        (values, idx) = self.check(values);
+        (uidx, counts) = np.unique(idx, return_counts = True);
+        have = self.tree_query(uidx)[0] - self.tree_query(uidx - 1)[0];
+        if np.any(have < counts - 0.5):
+            raise ValueError("'values' contains observations that are not in the multiset.");
+        self.tree_update(idx, values, -1);
+        self.batch_terms(values, -1);
+        self.rank_sum -= np.dot(values, np.arange(1, len(values)+1)) + self.cross_term(values);
+        return self;
+    
+    
+    def report(self, base:str = 'e') -> np.void:
+        '''
+        Current indices, as a record with the same fields as 
+        'inequality_report'.
+        '''
+        n = self.n;
+        report = np.zeros(1, dtype = REPORT_DTYPE)[0];
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            S = np.float64(self.x_sum);
+            report['gini'] = 2.0 * self.rank_sum / (n * S) - (n+1)/n;
+            report['herfindahl'] = self.x2_sum / (S*S);
+            
+            # sum(|x - mu|) from the count and sum of the values up to the mean
+            mu = S / n;
+            (count_le, sum_le) = [x[0] for x in self.tree_query(np.searchsorted(self.levels, [mu], side = 'right'))];
+            abs_dev = (mu*count_le - sum_le) + ((S - sum_le) - mu*(n - count_le));
+            report['robin_hood'] = 0.5 * abs_dev / S;
+            
+            ln_base = {'e': 1.0, '2': np.log(2), 2: np.log(2), '10': np.log(10), 10: np.log(10)}[base];
+            mu_pos = self.pos_sum / self.n_pos;
+            report['theil_L'] = (np.log(mu_pos) - self.logx_sum / self.n_pos) / ln_base;
+            report['theil_T'] = (self.xlogx_sum / self.pos_sum - np.log(mu_pos)) / ln_base;
+            report['theil_S'] = (report['theil_L'] + report['theil_T'])/2.0;
+        return report;
+
+
+
+def rolling_inequality(mat:np.ndarray,
+                       window:int,
+                       base:str = 'e') -> np.ndarray:
+    '''
+    Inequality indices over a sliding window of periods, updated 
+    incrementally as periods enter and leave the window (see 
+    'RollingInequality'). Each step costs O(k log n) for k observations per 
+    period and n in the window, instead of a sort of the whole window. This 
+    pays off for windows of more than about 10^4 observations; smaller 
+    windows are faster with 'inequality_report' on each window.
+    
+    Parameters:
+    -----
+    mat: numpy 1-d or 2-d array.
+         1-d: a series, one observation per period.
+         2-d: Row: observation (e.g. region)
+              Col: period (e.g. year)
+         Missing observations can be NaN.
+    window: integer. Number of periods (columns) pooled in each window.
+    base: string. Base of the logs in the Theil indices. 'e' (default), '2' 
+         or '10'.
+    
+    Returns
+    -----
+    numpy structured array with the same fields as 'inequality_report', one 
+    record per window, i.e. for columns [t, t+window) for t = 0, 1, ....
+    '''
+    allowed_bases = ['e', '2', '10', 2, 10];
+    if base not in allowed_bases:
+        raise ValueError("'base' must be either of the following: '{}'.".format(
+            "', '".join(allowed_bases[:3])));
+    if mat.ndim not in [1, 2]:
+        raise ValueError("'mat' must be a 1-d or 2-d array, but currently its dimension is {}.".format(mat.ndim));
+    if mat.ndim == 1:
+        mat = mat[np.newaxis, :];
+    if window < 1 or window > mat.shape[1]:
+        raise ValueError("'window' must be between 1 and the number of columns of 'mat' ({a}), but currently it is {b}.".format(a=mat.shape[1], b=window));
+    
+    roll = RollingInequality(mat);
+    roll.add(mat[:, :window]);
+    report = [roll.report(base)];
+    for t in range(window, mat.shape[1]):
+        roll.remove(mat[:, t - window]);
+        roll.add(mat[:, t]);
+        report.append(roll.report(base));
+    
+    return np.asarray(report, dtype = REPORT_DTYPE);
@@ -0,0 +1,289 @@
+#!/usr/bin/python3.11
+# -*- coding: utf-8 -*-
+
+# Matrices and vectors carrying the labels of their rows and columns (e.g.
+# HS codes and ISO3 codes), so that data from different sources can be
+# aligned by label instead of by hand-made dicts of positions.
+#
+# A LabeledMatrix has the same layout as the input of 'rca':
+#        Row: Product/Task/ etc.  => 'rows' labels
+#        Col: Region              => 'cols' labels
+#
+# Looking up one label is O(1) (dict), looking up an array of labels is one
+# vectorized search. Selecting labels that sit next to each other in the
+# same order gives a view of the data; other selections use an index array.
+# Functions such as 'rca', 'prody', 'relatedness', 'pci' and 'eci' accept a
+# LabeledMatrix and return labeled results.
+
+
+import numpy as np
+
+
+def is_labeled(x) -> bool:
+    return isinstance(x, (LabeledMatrix, LabeledVector));
+
+
+
+def unlabeled(x):
+    '''
+    The bare values of a labeled object, or 'x' itself.
+    '''
+    return x.values if is_labeled(x) else x;
+
+
+
+def as_positions(pos: np.ndarray):
+    '''
+    A slice (so that indexing gives a view) when the positions are a run of
+    consecutive numbers, otherwise the index array itself.
+    '''
+    if len(pos) > 0 and pos[-1] - pos[0] == len(pos) - 1 and np.all(np.diff(pos) == 1):
+        return slice(int(pos[0]), int(pos[-1]) + 1);
+    return pos;
+
+
+
+class LabelIndex:
+    '''
+    Position of each label of an 1-d array of unique labels.
+    '''
+    def __init__(self, labels: np.ndarray):
+        self.labels = np.asarray(labels);
+        if self.labels.ndim != 1:
+            raise ValueError("Labels must be an 1-d array, but currently their dimension is {}.".format(self.labels.ndim));
+        self.sorter = np.argsort(self.labels, kind = 'stable');
+        sorted_labels = self.labels[self.sorter];
+        if len(sorted_labels) > 1 and np.any(sorted_labels[1:] == sorted_labels[:-1]):
+            raise ValueError("Labels must be unique.");
+        self.sorted_labels = sorted_labels;
+        self.lookup = None;
+
+
+    def __len__(self):
+        return len(self.labels);
+
+
+    def position(self, label) -> int:
+        if self.lookup is None:
+            self.lookup = {lab: i for (i, lab) in enumerate(self.labels.tolist())};
+        if label not in self.lookup:
+            raise KeyError(label);
+        return self.lookup[label];
+
+
+    def positions(self, labels, missing: str = 'raise') -> np.ndarray:
+        '''
+        Positions of an array of labels. Missing labels raise a ValueError,
+        or get -1 when 'missing' is 'ignore'.
+        '''
+        labels = np.asarray(labels);
+        if len(self.labels) == 0:
+            (isIn, pos) = (np.zeros(labels.shape, dtype = bool), np.full(labels.shape, -1));
+        else:
+            found = np.minimum(np.searchsorted(self.sorted_labels, labels), len(self.labels) - 1);
+            isIn = self.sorted_labels[found] == labels;
+            pos = np.where(isIn, self.sorter[found], -1);
+        if missing == 'raise' and not np.all(isIn):
+            raise ValueError("The following labels are not found: {}.".format(labels[~isIn][:10].tolist()));
+        return pos;
+
+
+    def common(self, *others) -> np.ndarray:
+        '''
+        Labels found in all the other label arrays, in the order of this one.
+        '''
+        isIn = np.ones(len(self.labels), dtype = bool);
+        for other in others:
+            isIn &= np.isin(self.labels, other);
+        return self.labels[isIn];
+
+
+
+class LabeledVector:
+    '''
+    1-d array of values, with one label per element.
+
+    Parameters
+    -----
+    values: numpy 1-d array.
+    labels: numpy 1-d array of unique labels, one per element of 'values'.
+    '''
+    def __init__(self, values: np.ndarray, labels):
+        values = np.asarray(values);
+        index = labels if isinstance(labels, LabelIndex) else LabelIndex(labels);
+        if values.ndim != 1 or len(values) != len(index):
+            raise ValueError("'values' must be an 1-d array with one element per label ({a}), but currently its shape is {b}.".format(a=len(index), b=values.shape));
+        self.values = values;
+        self.index = index;
+
+
+    @property
+    def labels(self) -> np.ndarray:
+        return self.index.labels;
+
+
+    def __len__(self):
+        return len(self.values);
+
+
+    def __array__(self, dtype = None, copy = None):
+        return self.values if dtype is None else self.values.astype(dtype);
+
+
+    def __getitem__(self, label):
+        return self.values[self.index.position(label)];
+
+
+    def __repr__(self):
+        return 'LabeledVector({} elements)'.format(len(self));
+
+
+    def select(self, labels) -> 'LabeledVector':
+        '''
+        The elements of the given labels, in that order (a view when they are
+        consecutive).
+        '''
+        pos = as_positions(self.index.positions(labels));
+        return LabeledVector(self.values[pos], self.labels[pos]);
+
+
+
+class LabeledMatrix:
+    '''
+    2-d array of values (numpy array or scipy sparse matrix), with labels for
+    its rows and its columns.
+
+    Parameters
+    -----
+    values: numpy 2-d array or scipy sparse matrix.
+            Row: Product/Task/ etc.
+            Col: Region
+    rows: numpy 1-d array of unique labels, one per row.
+    cols: numpy 1-d array of unique labels, one per column.
+    '''
+    def __init__(self, values, rows, cols):
+        row_index = rows if isinstance(rows, LabelIndex) else LabelIndex(rows);
+        col_index = cols if isinstance(cols, LabelIndex) else LabelIndex(cols);
+        if values.ndim != 2 or values.shape != (len(row_index), len(col_index)):
+            raise ValueError("'values' must be a 2-d array of (rows x cols) = {a}, but currently its shape is {b}.".format(a=(len(row_index), len(col_index)), b=values.shape));
+        self.values = values;
+        self.row_index = row_index;
+        self.col_index = col_index;
+
+
+    @property
+    def rows(self) -> np.ndarray:
+        return self.row_index.labels;
+
+
+    @property
+    def cols(self) -> np.ndarray:
+        return self.col_index.labels;
+
+
+    @property
+    def shape(self) -> tuple:
+        return self.values.shape;
+
+
+    @property
+    def ndim(self) -> int:
+        return 2;
+
+
+    @property
+    def T(self) -> 'LabeledMatrix':
+        return LabeledMatrix(self.values.T, self.col_index, self.row_index);
+
+
+    def __array__(self, dtype = None, copy = None):
+        values = self.values.toarray() if hasattr(self.values, 'toarray') else self.values;
+        return values if dtype is None else values.astype(dtype);
+
+
+    def __repr__(self):
+        return 'LabeledMatrix({a} rows x {b} cols)'.format(a=self.shape[0], b=self.shape[1]);
+
+
+    def loc(self, row, col):
+        '''
+        The value at one row label and one column label.
+        '''
+        return self.values[self.row_index.position(row), self.col_index.position(col)];
+
+
+    def row(self, label) -> LabeledVector:
+        values = self.values[self.row_index.position(label)];
+        values = values.toarray().ravel() if hasattr(values, 'toarray') else values;
+        return LabeledVector(values, self.col_index);
+
+
+    def col(self, label) -> LabeledVector:
+        values = self.values[:, self.col_index.position(label)];
+        values = values.toarray().ravel() if hasattr(values, 'toarray') else values;
+        return LabeledVector(values, self.row_index);
+
+
+    def like(self, values, rows: bool = True, cols: bool = True):
+        '''
+        New values with the same labels: both axes (a LabeledMatrix), or only
+        the rows or the columns (a LabeledVector).
+        '''
+        if rows and cols:
+            return LabeledMatrix(values, self.row_index, self.col_index);
+        return LabeledVector(values, self.row_index if rows else self.col_index);
+
+
+    def select(self, rows = None, cols = None) -> 'LabeledMatrix':
+        '''
+        The rows and columns of the given labels, in that order (None keeps
+        all of them). Runs of consecutive rows or columns give views.
+        '''
+        row_pos = slice(None) if rows is None else as_positions(self.row_index.positions(rows));
+        col_pos = slice(None) if cols is None else as_positions(self.col_index.positions(cols));
+        if isinstance(row_pos, slice) or isinstance(col_pos, slice):
+            values = self.values[row_pos, col_pos];
+        else:
+            values = self.values[np.ix_(row_pos, col_pos)];
+        row_index = self.row_index if rows is None else LabelIndex(self.rows[row_pos]);
+        col_index = self.col_index if cols is None else LabelIndex(self.cols[col_pos]);
+        return LabeledMatrix(values, row_index, col_index);
+
+
+
+def align_cols(mat: LabeledMatrix, *vectors):
+    '''
+    Align labeled vectors (e.g. GDP per capita of each region) with the
+    columns of a labeled matrix, keeping the columns found in all of them.
+    A LabeledMatrix among the vectors (e.g. regions x indicators) is aligned
+    on its rows. Unlabeled vectors (and None) are returned as they are, and
+    must already be aligned.
+
+    Returns
+    -----
+    (mat, vector1, vector2, ...) with the same column labels.
+    '''
+    labeled = [v.labels if isinstance(v, LabeledVector) else v.rows
+               for v in vectors if is_labeled(v)];
+    if len(labeled) == 0:
+        return (mat,) + tuple(vectors);
+    common = mat.col_index.common(*labeled);
+    if len(common) < mat.shape[1]:
+        mat = mat.select(cols = common);
+    return (mat,) + tuple(v.select(common) if isinstance(v, LabeledVector) else
+                          v.select(rows = common) if isinstance(v, LabeledMatrix) else v
+                          for v in vectors);
+
+
+
+def align_rows(mat: LabeledMatrix, other: LabeledMatrix):
+    '''
+    Align two labeled matrices on their rows, keeping the rows found in both,
+    in the order of 'mat'.
+    '''
+    common = mat.row_index.common(other.rows);
+    if len(common) < mat.shape[0]:
+        mat = mat.select(rows = common);
+    if len(common) < other.shape[0] or np.any(other.rows != common):
+        other = other.select(rows = common);
+    return (mat, other);
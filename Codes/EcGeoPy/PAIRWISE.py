@@ -0,0 +1,149 @@
+#!/usr/bin/python3.11
+# -*- coding: utf-8 -*-
+
+# Helpers for pairwise (region x region, item x item) matrices that are too
+# large to be handled in one go. The matrix is computed in blocks of rows,
+# and optionally only the top-k entries of each row are kept.
+
+
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from scipy.spatial.distance import cdist;
+except ImportError:
+    cdist = None;
+
+
+def row_blocks(n:int, block_size:int):
+    '''
+    Yield slices covering range(n) in consecutive blocks of 'block_size' rows.
+    '''
+    if block_size < 1:
+        raise ValueError("'block_size' must be a positive integer, but currently it is {}.".format(block_size));
+    for start in range(0, n, block_size):
+        yield slice(start, min(start + block_size, n));
+
+
+def top_k(block:np.ndarray,
+          k:int,
+          offset:int = 0,
+          largest:bool = True) -> tuple[np.ndarray, np.ndarray]:
+    '''
+    Keep the k largest (or smallest) entries of each row of a block of a
+    pairwise matrix, ignoring the diagonal of the full matrix.
+
+    Parameters
+    -----
+    block: numpy 2-d array. Rows 'offset' to 'offset + len(block)' of a square
+           pairwise matrix.
+
+    k: integer. Number of entries kept per row.
+
+    offset: integer. Row number (in the full matrix) of the first row of 'block'.
+
+    largest: bool. Keep the largest entries (e.g. similarities, default), or
+             the smallest entries (e.g. distances).
+
+    Returns
+    -----
+    (idx, val): two numpy 2-d arrays of shape (len(block), k), the column
+                indices and values of the kept entries, sorted from the
+                nearest to the farthest.
+    '''
+    if k < 1:
+        raise ValueError("'k' must be a positive integer, but currently it is {}.".format(k));
+
+    b, n = block.shape;
+    k = min(k, n-1) if n > 1 else 1;
+
+    score = -block if largest else block.copy();
+    score = score.astype(float, copy = False);
+    rows = np.arange(b);
+    diag = rows + offset;
+    isSelf = diag < n;
+    score[rows[isSelf], diag[isSelf]] = np.inf;
+
+    if k < n:
+        idx = np.argpartition(score, k-1, axis = 1)[:, :k];
+    else:
+        idx = np.broadcast_to(np.arange(n), (b, n)).copy();
+    seq = np.argsort(np.take_along_axis(score, idx, axis = 1), axis = 1);
+    idx = np.take_along_axis(idx, seq, axis = 1);
+    val = np.take_along_axis(block, idx, axis = 1);
+
+    return (idx, val);
+
+
+
+def l1_block(A:np.ndarray, B:np.ndarray) -> np.ndarray:
+    '''
+    L1 (city block) distances between the rows of A and the rows of B, in 
+    the dtype of A. Uses scipy when installed, otherwise numpy in tiles small
+    enough to stay in cache.
+    '''
+    if cdist is not None:
+        return cdist(A, B, 'cityblock').astype(A.dtype, copy = False);
+    
+    (tile_rows, tile_cols) = (32, 128);
+    out = np.zeros([len(A), len(B)], dtype = A.dtype);
+    buf = np.empty([tile_rows, len(B), tile_cols], dtype = A.dtype);
+    for i in range(0, len(A), tile_rows):
+        a = A[i:i+tile_rows];
+        for j in range(0, A.shape[1], tile_cols):
+            diff = buf[:len(a), :, :min(tile_cols, A.shape[1]-j)];
+            np.subtract(a[:, np.newaxis, j:j+tile_cols], B[np.newaxis, :, j:j+tile_cols], out = diff);
+            np.abs(diff, out = diff);
+            out[i:i+tile_rows] += diff.sum(axis = 2);
+    return out;
+
+
+
+def pairwise_l1(mat:np.ndarray,
+                block_size:int = 256,
+                k:int | None = None,
+                n_jobs:int = 1,
+                dtype = np.float32) -> np.ndarray | tuple[np.ndarray, np.ndarray]:
+    '''
+    L1 distances between all pairs of rows of 'mat', computed in blocks of 
+    'block_size' x 'block_size' pairs, on a pool of 'n_jobs' threads (numpy
+    and scipy release the GIL in the distance kernels).
+    
+    Without 'k', only the blocks on and above the diagonal are computed and 
+    mirrored, and the full (rows x rows) matrix is returned. With 'k', each 
+    block of rows is compared with all rows, and only the k nearest rows are 
+    kept (see 'top_k'), as a tuple (idx, val).
+    '''
+    if mat.ndim != 2:
+        raise ValueError("'mat' must be a 2-d array, but currently its dimension is {}.".format(mat.ndim));
+    if n_jobs < 1:
+        raise ValueError("'n_jobs' must be a positive integer, but currently it is {}.".format(n_jobs));
+    X = np.ascontiguousarray(mat, dtype = dtype);
+    n = len(X);
+    blocks = list(row_blocks(n, block_size));
+    
+    if k is None:
+        D = np.empty([n, n], dtype = dtype);
+        def task(pair):
+            (bi, bj) = pair;
+            D[bi, bj] = l1_block(X[bi], X[bj]);
+            if bi != bj:
+                D[bj, bi] = D[bi, bj].T;
+        tasks = [(bi, bj) for (i, bi) in enumerate(blocks) for bj in blocks[i:]];
+    else:
+        def task(bi):
+            dist = np.concatenate([l1_block(X[bi], X[bj]) for bj in blocks], axis = 1);
+            return top_k(dist, k, offset = bi.start, largest = False);
+        tasks = blocks;
+    
+    if n_jobs == 1:
+        results = list(map(task, tasks));
+    else:
+        with ThreadPoolExecutor(max_workers = n_jobs) as pool:
+            results = list(pool.map(task, tasks));
+    
+    if k is None:
+        return D;
+    if len(results) == 0:
+        return (np.zeros([0, 1], dtype = int), np.zeros([0, 1], dtype = dtype));
+    return (np.concatenate([r[0] for r in results]), np.concatenate([r[1] for r in results]));
@@ -0,0 +1,257 @@
+#!/usr/bin/python3.11
+# -*- coding: utf-8 -*-
+
+# On-disk store of a panel of matrices (e.g. exports of each year), in the
+# same layout as the input of 'rca':
+#        Row: Product/Task/ etc.
+#        Col: Region
+#
+# A store is a directory with one .npy file per year and a small file
+# "meta.json" with the row and column labels, and the shape, dtype and
+# checksum of each year:
+#
+#   panel/meta.json
+#   panel/1995.npy
+#   panel/1996.npy
+#   ...
+#
+# Opening a store only reads "meta.json". Each year is opened when first
+# asked for, as a read-only np.memmap of its file, so that nothing is copied
+# or parsed: the pages of the file are read by the OS as they are used (e.g.
+# by 'rca', 'relatedness', 'pci' or 'eci', which do not change their input).
+# New years are added with 'append'; the files are written to a temporary
+# name and then renamed, so that readers never see half-written years.
+
+
+import os
+import json
+import hashlib
+import numpy as np
+from .LABELED import LabeledMatrix, LabelIndex
+
+
+META_FILE = 'meta.json';
+PANEL_FORMAT = 1;
+
+
+def array_checksum(mat: np.ndarray, chunk_rows: int = 4096) -> str:
+    '''
+    blake2b checksum of the bytes of an array, hashed a block of rows at a
+    time (so that memmaps are not read into memory at once).
+    '''
+    h = hashlib.blake2b(digest_size = 16);
+    for start in range(0, max(mat.shape[0], 1), chunk_rows):
+        h.update(np.ascontiguousarray(mat[start:start+chunk_rows]).data);
+    return h.hexdigest();
+
+
+
+def json_labels(labels: np.ndarray) -> list:
+    return np.asarray(labels).tolist();
+
+
+
+def store_files(path: str) -> set:
+    '''
+    Names of the files of the store at 'path' (the metadata file and the
+    files of the years it lists), or an empty set if there is no store.
+    '''
+    meta_path = os.path.join(path, META_FILE);
+    if not os.path.exists(meta_path):
+        return set();
+    with open(meta_path, 'r') as f:
+        meta = json.load(f);
+    return {META_FILE} | {info['file'] for info in meta.get('years', dict()).values()};
+
+
+
+class PanelStore:
+    '''
+    Directory of .npy files, one matrix per year, sharing the same row and
+    column labels.
+
+    Parameters
+    -----
+    path: string. Directory of the store.
+    mode: string. "r" to read an existing store (default), "a" to read it
+          and append new years, or "w" to create a new, empty store
+          (replacing the years of an existing one).
+    rows, cols: numpy 1-d arrays of labels (e.g. HS codes and iso3 codes).
+          Only for mode "w".
+    dtype: numpy dtype of the stored values. Only for mode "w". Default
+          float64.
+    overwrite: bool. Only for mode "w". Default False. Mode "w" only removes
+          the files listed in the metadata of an existing store, and refuses
+          a directory with other files in it, unless 'overwrite' is True
+          (the other files are then kept, but years written later replace
+          files of the same name).
+    '''
+    def __init__(self, path: str, mode: str = 'r', rows = None, cols = None, dtype = np.float64,
+                 overwrite: bool = False):
+        if mode not in ['r', 'a', 'w']:
+            raise ValueError("'mode' must be 'r', 'a' or 'w', but currently it is {}.".format(mode));
+        self.path = path;
+        self.mode = mode;
+        self.opened = dict();
+
+        if mode == 'w':
+            if rows is None or cols is None:
+                raise ValueError("'rows' and 'cols' must be supplied to create a store.");
+            os.makedirs(path, exist_ok = True);
+            own = store_files(path);
+            others = sorted(set(os.listdir(path)) - own);
+            if len(others) > 0 and not overwrite:
+                raise ValueError("'{a}' contains files that are not part of a panel store ({b}), use 'overwrite' to write into it anyway.".format(a=path, b=others[:10]));
+            for name in own:
+                if os.path.exists(os.path.join(path, name)):
+                    os.remove(os.path.join(path, name));
+            self.meta = {'format': PANEL_FORMAT,
+                         'rows': json_labels(rows),
+                         'cols': json_labels(cols),
+                         'dtype': np.dtype(dtype).str,
+                         'years': dict()};
+            self.write_meta();
+        else:
+            meta_path = os.path.join(path, META_FILE);
+            if not os.path.exists(meta_path):
+                raise ValueError("'{}' is not a panel store (no {}).".format(path, META_FILE));
+            with open(meta_path, 'r') as f:
+                self.meta = json.load(f);
+            if self.meta.get('format') != PANEL_FORMAT:
+                raise ValueError("Unknown format of the panel store '{a}': {b}.".format(a=path, b=self.meta.get('format')));
+
+        self.row_index = LabelIndex(np.asarray(self.meta['rows']));
+        self.col_index = LabelIndex(np.asarray(self.meta['cols']));
+        self.dtype = np.dtype(self.meta['dtype']);
+
+
+    @property
+    def rows(self) -> np.ndarray:
+        return self.row_index.labels;
+
+
+    @property
+    def cols(self) -> np.ndarray:
+        return self.col_index.labels;
+
+
+    @property
+    def years(self) -> list:
+        return sorted(int(y) for y in self.meta['years']);
+
+
+    @property
+    def shape(self) -> tuple:
+        return (len(self.meta['years']), len(self.rows), len(self.cols));
+
+
+    def __len__(self):
+        return len(self.meta['years']);
+
+
+    def __contains__(self, year) -> bool:
+        return str(year) in self.meta['years'];
+
+
+    def __repr__(self):
+        return 'PanelStore({a}: {b} years x {c} rows x {d} cols)'.format(a=self.path, b=len(self), c=len(self.rows), d=len(self.cols));
+
+
+    def __getitem__(self, year) -> np.memmap:
+        '''
+        The matrix of 'year', as a read-only np.memmap (opened at the first
+        call and reused afterwards).
+        '''
+        key = str(year);
+        if key not in self.meta['years']:
+            raise KeyError(year);
+        if key not in self.opened:
+            info = self.meta['years'][key];
+            mat = np.load(os.path.join(self.path, info['file']), mmap_mode = 'r');
+            if list(mat.shape) != info['shape'] or mat.dtype != self.dtype:
+                raise ValueError("The file of year {a} does not match the metadata of the store: shape {b} and dtype {c}.".format(a=year, b=mat.shape, c=mat.dtype));
+            self.opened[key] = mat;
+        return self.opened[key];
+
+
+    def labeled(self, year) -> LabeledMatrix:
+        '''
+        The matrix of 'year' with the labels of its rows and columns.
+        '''
+        return LabeledMatrix(self[year], self.row_index, self.col_index);
+
+
+    def stack(self, years = None) -> np.ndarray:
+        '''
+        3-d array (years x rows x cols) of the given years (all by default),
+        e.g. for 'prody' and 'expy'. Unlike single years, this is a copy in
+        memory.
+        '''
+        years = self.years if years is None else list(years);
+        out = np.empty((len(years), len(self.rows), len(self.cols)), dtype = self.dtype);
+        for (t, year) in enumerate(years):
+            out[t] = self[year];
+        return out;
+
+
+    def append(self, year, mat, overwrite: bool = False):
+        '''
+        Add the matrix of a year to the store (mode "a" or "w").
+
+        Parameters
+        -----
+        year: integer.
+        mat: numpy 2-d array with the rows and columns of the store, or a
+             LabeledMatrix whose labels are found among those of the store
+             (rows and columns missing from it are filled with zeros).
+        overwrite: bool. Replace the year if it is already in the store.
+             Default False.
+        '''
+        if self.mode == 'r':
+            raise ValueError("The store '{}' is opened read-only (mode 'r').".format(self.path));
+        key = str(int(year));
+        if key in self.meta['years'] and not overwrite:
+            raise ValueError("Year {} is already in the store, use 'overwrite' to replace it.".format(year));
+
+        if isinstance(mat, LabeledMatrix):
+            row_pos = self.row_index.positions(mat.rows);
+            col_pos = self.col_index.positions(mat.cols);
+            values = np.asarray(mat);
+            mat = np.zeros((len(self.rows), len(self.cols)), dtype = self.dtype);
+            mat[np.ix_(row_pos, col_pos)] = values;
+        mat = np.ascontiguousarray(mat, dtype = self.dtype);
+        if mat.shape != (len(self.rows), len(self.cols)):
+            raise ValueError("'mat' must have the shape of the store (rows x cols) = {a}, but currently its shape is {b}.".format(a=(len(self.rows), len(self.cols)), b=mat.shape));
+
+        name = '{}.npy'.format(key);
+        temp_path = os.path.join(self.path, name + '.tmp');
+        with open(temp_path, 'wb') as f:
+            np.save(f, mat);
+        if key in self.opened:
+            del self.opened[key];
+        os.replace(temp_path, os.path.join(self.path, name));
+
+        self.meta['years'][key] = {'file': name,
+                                   'shape': list(mat.shape),
+                                   'checksum': array_checksum(mat)};
+        self.write_meta();
+
+
+    def verify(self, years = None) -> bool:
+        '''
+        Check the data of the given years (all by default) against their
+        checksums. Raises a ValueError for the first year that differs. This
+        reads the whole files, so it is not done when opening the store.
+        '''
+        years = self.years if years is None else list(years);
+        for year in years:
+            if array_checksum(self[year]) != self.meta['years'][str(year)]['checksum']:
+                raise ValueError("The data of year {a} in the store '{b}' does not match its checksum.".format(a=year, b=self.path));
+        return True;
+
+
+    def write_meta(self):
+        temp_path = os.path.join(self.path, META_FILE + '.tmp');
+        with open(temp_path, 'w') as f:
+            json.dump(self.meta, f);
+        os.replace(temp_path, os.path.join(self.path, META_FILE));
@@ -3,26 +3,149 @@
 
 
 import numpy as np
-from .RCA import rca;
+from .RCA import is_sparse;
+from .LABELED import LabeledMatrix, align_cols, unlabeled;
+
+def nonnegative(exp_mat):
+    '''
+    Export data with negative values set to zero (the input is not changed,
+    and only copied when it has negative values), dense or sparse.
+    '''
+    if is_sparse(exp_mat):
+        if exp_mat.nnz > 0 and exp_mat.data.min() < 0:
+            exp_mat = exp_mat.copy();
+            exp_mat.data[exp_mat.data < 0] = 0;
+            exp_mat.eliminate_zeros();
+        return exp_mat;
+    if exp_mat.size > 0 and exp_mat.min() < 0:
+        return np.maximum(exp_mat, 0);
+    return exp_mat;
+
+
+
+def column_sums(mat) -> np.ndarray:
+    return np.asarray(mat.sum(axis = 0)).ravel().astype(float);
+
+
+
+def indicators(val: np.ndarray, n_years: int | None = None) -> np.ndarray:
+    '''
+    'val' as (regions x indicators), or (years x regions x indicators) for a
+    panel of 'n_years'.
+    '''
+    if n_years is None:
+        return val.reshape(val.shape[0], -1);
+    return val.reshape(n_years, val.shape[1], -1);
+
+
+
+def labeled_indicators(mat: LabeledMatrix, val, PRD: np.ndarray, rows: bool = True):
+    '''
+    Label a result of (products or regions) x indicators: the indicators are
+    the columns of 'val' when it is a LabeledMatrix, else 0, 1, 2, ...
+    '''
+    cols = val.col_index if isinstance(val, LabeledMatrix) else np.arange(PRD.shape[1]);
+    return LabeledMatrix(PRD, mat.row_index if rows else mat.col_index, cols);
+
+
+
+def check_inputs(mat: np.ndarray,
+                 val: np.ndarray,
+                 weight: np.ndarray | None,
+                 mat_name: str = 'mat'):
+    '''
+    Validate the dimensions of the inputs of 'prody' and 'expy'.
+    '''
+    if mat.ndim not in [2, 3]:
+        raise ValueError("'{a}' must be a 2-d array, or a 3-d array of years, but currently its dimension is {b}.".format(a=mat_name, b=mat.ndim));
+    
+    if mat.ndim == 2:
+        if val.ndim not in [1, 2]:
+            raise ValueError("'val' must be a 1-d or 2-d array, but currently its dimension is {}.".format(val.ndim));
+        if val.shape[0] != mat.shape[1]:
+            raise ValueError("'val' must have the same number of elements (rows) as the number of regions implied by '{}'".format(mat_name));
+    else:
+        if val.ndim not in [2, 3]:
+            raise ValueError("When '{a}' is a 3-d array, 'val' must be a 2-d or 3-d array, but currently its dimension is {b}.".format(a=mat_name, b=val.ndim));
+        if val.shape[:2] != (mat.shape[0], mat.shape[2]):
+            raise ValueError("When '{a}' is a 3-d array, 'val' must be in the shape of (years, regions[, indicators]) = {b}, but currently its shape is {c}.".format(a=mat_name, b=(mat.shape[0], mat.shape[2]), c=val.shape));
+    
+    # Checking if weight is supplied, if is, then dimension must correspond to mat
+    if weight is not None:
+        if weight.ndim not in [1, mat.ndim - 1]:
+            raise ValueError("'weight' must be a 1-d array (or years x regions when '{a}' is 3-d), but currently its dimension is {b}.".format(a=mat_name, b=weight.ndim));
+        if weight.shape[-1] != mat.shape[-1]:
+            raise ValueError("'weight' must have the same number of elements as the number of regions implied by '{}'".format(mat_name));
+        if weight.ndim == 2 and weight.shape[0] != mat.shape[0]:
+            raise ValueError("A 2-d 'weight' must have one row per year in '{}'".format(mat_name));
+
+
+
+def prody_leave_one_out(exp_mat: np.ndarray,
+                        V: np.ndarray,
+                        weight: np.ndarray | None = None) -> np.ndarray:
+    '''
+    PRODY of each product, leaving out each region in turn, from export data
+    (products x regions) and indicators V (regions x indicators). Returns an
+    array of (products x left-out regions x indicators). With a leading axis
+    of years in 'exp_mat', 'V' (and 'weight'), there is one in the result.
+    
+    Without region c, the world export share of product p changes, but it is
+    the same factor for all the other regions and cancels out of PRODY:
+    
+        PRODY_(-c),p = (sum_r w_r s_pr v_r - w_c s_pc v_c) / (sum_r w_r s_pr - w_c s_pc)
+    
+    with s_pr = x_pr / X_r the share of product p in the exports of region r.
+    So all of them come from the full sample sums in O(products x regions).
+    '''
+    x = nonnegative(exp_mat);
+    x = x.toarray().astype(float) if is_sparse(x) else x.astype(float);
+    reg_sum = np.sum(x, -2);
+    reg_sum[reg_sum<=0] = 0.123;
+    w = 1.0 if weight is None else weight.astype(float);
+    
+    # With a leading axis of years, all of them at once
+    ws = x * (w / reg_sum)[..., np.newaxis, :];
+    NUM = np.matmul(ws, V);
+    DEN = ws.sum(-1);
+    
+    # Products exported by no other region than c get 0, as in 'prody'. This
+    # is decided on counts, so that rounding in DEN - ws cannot matter.
+    isIn = ws != 0;
+    noOther = (isIn.sum(-1, keepdims = True) - isIn) == 0;
+    den_loo = DEN[..., np.newaxis] - ws;
+    den_loo[noOther] = 12345;
+    PRD = (NUM[..., :, np.newaxis, :] - ws[..., np.newaxis] * V[..., np.newaxis, :, :]) / den_loo[..., np.newaxis];
+    PRD[noOther] = 0;
+    
+    return PRD;
+
+
 
 def prody(mat: np.ndarray,
           val: np.ndarray,
           input_type: str = 'Export',
-          weight: np.ndarray | None = None) -> np.ndarray:
+          weight: np.ndarray | None = None,
+          leave_one_out: bool = False) -> np.ndarray:
     '''
     Generate Prody (alike) index
     
     Parameters
     -----
-    mat: numpy 2-d array, either of the two:
+    mat: numpy 2-d array or scipy sparse matrix, either of the two:
           * Export data (default)
           - RCA values
         Row: Product/Task/ etc.
         Col: Region
+        Or a 3-d array of such matrices, one per year (years x products x 
+        regions).
     
     val: numpy 1-d array.
          Measuring how great is each region (e.g. things like realgdppc)
          Dimension must correspond to the number of regions in mat.
+         A 2-d array (regions x indicators) gives the PRODY of every 
+         indicator at once. With a 3-d 'mat', 'val' is (years x regions) or 
+         (years x regions x indicators).
     
     input_type: String variable indicating input type, must be one of the two
                 * "Export" => regional export data (Default)
@@ -32,91 +155,151 @@ def prody(mat: np.ndarray,
     weight: numpy 1-d array. Optional. 
             Importance weight of each region (e.g. population, gdp size, etc). 
             Dimension must correspond to the number of regions in mat.
-    '''
-    
-    if mat.ndim != 2:
-        raise ValueError("'mat' must be a 2-d array, but currently its dimension is {}.".format(mat.ndim));
+            With a 3-d 'mat', it can also be (years x regions).
     
-    if val.ndim != 1:
-        raise ValueError("'val' must be a 1-d array, but currently its dimension is {}.".format(val.ndim));
+    leave_one_out: bool. Default False. If True, the PRODY of each product is
+            computed once leaving out each region (e.g. to use in the EXPY 
+            of that region), as if 'prody' was called on 'mat' without that
+            column, and an axis of left-out regions is added after the axis
+            of products. Only for export data ('input_type' = 'Export').
     
-    if val.shape[0] != mat.shape[1]:
-        raise ValueError("'val' must have the same number of elements as the number of regions implied by 'mat'");
+    Returns
+    -----
+    numpy array of (products), (products x indicators), (years x products) 
+    or (years x products x indicators), following the shape of 'val'.
+    With a LabeledMatrix 'mat', 'val' and 'weight' can be LabeledVectors of
+    regions (or 'val' a LabeledMatrix of regions x indicators): only the
+    regions found in all of them are used, and the result is labeled by 
+    product (and left-out region, or indicator). With an unlabeled 2-d 
+    'val', the indicators are labeled 0, 1, 2, ...
+    A 3-d 'mat' is computed for all the years at once with batched matrix
+    products.
+    '''
+    if isinstance(mat, LabeledMatrix):
+        (mat, val, weight) = align_cols(mat, val, weight);
+        PRD = prody(mat.values, unlabeled(val), input_type, unlabeled(weight), leave_one_out);
+        if PRD.ndim == 1:
+            return mat.like(PRD, cols = False);
+        if leave_one_out:
+            return mat.like(PRD) if PRD.ndim == 2 else PRD;
+        return labeled_indicators(mat, val, PRD);
     
+    check_inputs(mat, val, weight);
     
     # Checking type of input
     allowed_types = ['RCA', 'Export'];
     if input_type not in allowed_types:
         raise ValueError("'input_type' must be one of: {}.".format(", ".join(allowed_types)));
+    if leave_one_out and input_type != 'Export':
+        raise ValueError("'leave_one_out' needs export data, i.e. 'input_type' = 'Export'.");
     
-    # Checking if weight is supplied, if is, then dimension must correspond to mat
-    if weight is not None:
-        if weight.ndim != 1:
-            raise ValueError("'weight' must be a 1-d array, but currently its dimension is {}.".format(weight.ndim));
-        if weight.shape[0] != mat.shape[1]:
-            raise ValueError("'weight' must have the same number of elements as the number of regions implied by 'mat'");
+    # Years (for a 3-d 'mat') are a leading axis of the products below
+    n_years = mat.shape[0] if mat.ndim == 3 else None;
+    V = indicators(val, n_years);
+    one_indicator = val.ndim == mat.ndim - 1;
     
+    if leave_one_out:
+        PRD = prody_leave_one_out(mat, V, weight);
+        return PRD[..., 0] if one_indicator else PRD;
     
+    # With RCA = (x_pr / X_r) / (W_p / W), the world share W_p / W is the 
+    # same for all regions and cancels out of PRODY, so it is computed from
+    # the exports with matrix-vector products, without any RCA matrix or 
+    # products x regions temporary (and works with sparse 'mat').
     if input_type == 'Export':
-        mat = rca(mat);
+        mat = nonnegative(mat);
+        reg_sum = column_sums(mat) if n_years is None else mat.sum(axis = 1, dtype = float);
+        reg_sum[reg_sum<=0] = 0.123;
+        scale = 1.0 / reg_sum;
+    else:
+        scale = np.ones(mat.shape[::2] if n_years is not None else mat.shape[1]);
     
+    # All indicators (and all years) in one matrix product
     if weight is not None:
-        DEN = np.sum(mat * weight, 1);
-        DEN[DEN==0] = 12345;
-        PRD = np.sum(mat * weight * val, 1) / DEN;
-    else: 
-        DEN = np.sum(mat, 1);
-        DEN[DEN==0] = 54321;
-        PRD = np.sum(mat * val, 1) / DEN;
+        scale = scale * weight;
+    if n_years is None:
+        DEN = np.asarray(mat @ scale).ravel();
+        NUM = np.asarray(mat @ (scale.reshape(-1,1) * V));
+    else:
+        DEN = np.matmul(mat, scale[:, :, np.newaxis])[:, :, 0];
+        NUM = np.matmul(mat, scale[:, :, np.newaxis] * V);
+    DEN[DEN==0] = 12345 if weight is not None else 54321;
+    PRD = NUM / DEN[..., np.newaxis];
     
-    return PRD;
+    return PRD[..., 0] if one_indicator else PRD;
 
 
 
 def expy(exp_mat: np.ndarray,
          val: np.ndarray,
-         weight: np.ndarray | None = None) -> np.ndarray:
+         weight: np.ndarray | None = None,
+         leave_one_out: bool = False) -> np.ndarray:
     '''
     Generate EXPY (alike) index
     
     Parameters
     -----
-    exp_mat: numpy 2-d array, exports of each region
+    exp_mat: numpy 2-d array or scipy sparse matrix, exports of each region
              Row: Product/Task/ etc.
              Col: Region
+             Or a 3-d array of such matrices, one per year (years x products
+             x regions).
     
     val: numpy 1-d array.
          Measuring how great is each region (e.g. things like realgdppc)
          Dimension must correspond to the number of regions in mat.
+         A 2-d array (regions x indicators) gives the EXPY of every 
+         indicator at once. With a 3-d 'exp_mat', 'val' is (years x regions)
+         or (years x regions x indicators).
        
     weight: numpy 1-d array. Optional. 
             Importance weight of each region (e.g. population, gdp size, etc). 
             Dimension must correspond to the number of regions in mat.
+            With a 3-d 'exp_mat', it can also be (years x regions).
+    
+    leave_one_out: bool. Default False. If True, the EXPY of each region is
+            computed with the PRODY that leaves out the region itself (see
+            'prody').
+    
+    Returns
+    -----
+    numpy array of (regions), (regions x indicators), (years x regions) or 
+    (years x regions x indicators), following the shape of 'val'.
+    With a LabeledMatrix 'exp_mat', see 'prody'; the result is labeled by
+    region (and indicator).
     '''
-    if exp_mat.ndim != 2:
-        raise ValueError("'exp_mat' must be a 2-d array, but currently its dimension is {}.".format(exp_mat.ndim));
+    if isinstance(exp_mat, LabeledMatrix):
+        (exp_mat, val, weight) = align_cols(exp_mat, val, weight);
+        EXPY = expy(exp_mat.values, unlabeled(val), unlabeled(weight), leave_one_out);
+        if EXPY.ndim == 1:
+            return exp_mat.like(EXPY, rows = False);
+        return labeled_indicators(exp_mat, val, EXPY, rows = False);
     
-    if val.ndim != 1:
-        raise ValueError("'val' must be a 1-d array, but currently its dimension is {}.".format(val.ndim));
+    check_inputs(exp_mat, val, weight, 'exp_mat');
     
-    if val.shape[0] != exp_mat.shape[1]:
-        raise ValueError("'val' must have the same number of elements as the number of regions implied by 'exp_mat'");
+    n_years = exp_mat.shape[0] if exp_mat.ndim == 3 else None;
+    one_indicator = val.ndim == exp_mat.ndim - 1;
+    exp_mat = nonnegative(exp_mat);
+    DEN = column_sums(exp_mat) if n_years is None else exp_mat.sum(axis = 1, dtype = float);
+    DEN[DEN==0] = 9988;
     
-    # Checking if weight is supplied, if is, then dimension must correspond to mat
-    if weight is not None:
-        if weight.ndim != 1:
-            raise ValueError("'weight' must be a 1-d array, but currently its dimension is {}.".format(weight.ndim));
-        if weight.shape[0] != exp_mat.shape[1]:
-            raise ValueError("'weight' must have the same number of elements as the number of regions implied by 'exp_mat'");
+    if leave_one_out:
+        PRD = prody_leave_one_out(exp_mat, indicators(val, n_years), weight);
+        if is_sparse(exp_mat):
+            exp_mat = exp_mat.toarray();
+        EXPY = np.einsum('...pc,...pck->...ck', exp_mat / DEN[..., np.newaxis, :], PRD);
+        return EXPY[..., 0] if one_indicator else EXPY;
     
-    if weight is not None:
-        PRD = prody(exp_mat, val, weight = weight);
-    else:
-        PRD = prody(exp_mat, val);
+    PRD = prody(exp_mat, val, weight = weight);
+    if one_indicator:
+        PRD = PRD[..., np.newaxis];
     
-    DEN = np.sum(exp_mat, 0, keepdims = True);
-    DEN[DEN==0] = 9988;
-    reg_basket = exp_mat / DEN;
+    # Export basket of each region times PRODY, as one matrix product (over
+    # all the years at once for a 3-d 'exp_mat')
+    if n_years is None:
+        EXPY = np.asarray(exp_mat.T @ PRD) / DEN.reshape(-1,1);
+    else:
+        EXPY = np.matmul(exp_mat.transpose(0, 2, 1), PRD) / DEN[:, :, np.newaxis];
+    EXPY = EXPY[..., 0] if one_indicator else EXPY;
     
-    EXPY = np.sum( reg_basket * PRD.reshape(-1,1) , 0);
     return EXPY;
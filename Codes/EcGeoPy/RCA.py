@@ -23,23 +23,78 @@
 
 
 import numpy as np
+from .LABELED import LabeledMatrix
+from .BACI import factorize
+from .CACHE import memoize
 
+try:
+    import scipy.sparse as sps;
+except ImportError:
+    sps = None;
+
+
+def is_sparse(mat) -> bool:
+    '''
+    Whether 'mat' is a scipy sparse matrix/array. Always False when scipy is
+    not installed.
+    '''
+    return sps is not None and sps.issparse(mat);
+
+
+def rca_sparse(exp_mat):
+    '''
+    Generate RCA from sparse export data. Same as 'rca', but only the stored
+    (non-zero) entries are touched, and a scipy CSR matrix is returned.
+    '''
+    X = sps.csr_matrix(exp_mat, dtype = float, copy = True);
+    X.data[X.data<=0] = 0;
+    X.eliminate_zeros();
+    
+    reg_sum = np.asarray(X.sum(axis = 0)).ravel();
+    reg_sum[reg_sum<=0]=0.123;
+    prod_sum = np.asarray(X.sum(axis = 1)).ravel();
+    grandtotal = np.sum(reg_sum);
+    if X.nnz == 0:
+        raise ValueError("exp_mat has no positive values.");
+    
+    ExpWorldShare = prod_sum/grandtotal;
+    ExpWorldShare[ExpWorldShare<=0]=0.123;
+    
+    X = X.tocoo();
+    RCA = (X.data/reg_sum[X.col]) / ExpWorldShare[X.row];
+    
+    return sps.csr_matrix((RCA, (X.row, X.col)), shape = X.shape);
+
+
+@memoize
 def rca(exp_mat: np.ndarray) -> np.ndarray:
     '''
     Generate RCA from export data.
         
     parameters
     ----
-    exp_mat : np.ndarray
+    exp_mat : np.ndarray or scipy sparse matrix
               Must be 2-d dimension. 
               dim 0: product (i.e row)
               dim 1: region  (i.e. column) 
+              It is not changed (negative values are set to zero in a copy).
+              When a sparse matrix is supplied, a sparse (CSR) matrix is
+              returned. A LabeledMatrix gives a LabeledMatrix with the same
+              labels.
     '''
+    if isinstance(exp_mat, LabeledMatrix):
+        return exp_mat.like(rca(exp_mat.values));
+    
+    if is_sparse(exp_mat):
+        return rca_sparse(exp_mat);
     
     if exp_mat.ndim != 2:
         raise ValueError("exp_mat must be a 2-d array, currently the input dimension is {}.".format(exp_mat.ndim));
     
-    exp_mat[exp_mat<=0]=0;
+    # Not changed in place, so that read-only arrays (e.g. memmaps of a
+    # PanelStore) can be used
+    if exp_mat.size > 0 and exp_mat.min() < 0:
+        exp_mat = np.maximum(exp_mat, 0);
     if np.issubdtype(exp_mat.dtype, np.integer):
         exp_mat = exp_mat.astype(float);
     
@@ -76,6 +131,8 @@ def isRCA(exp_mat: np.ndarray,
                Indicating whether the output should be T/F, or 0/1.
                Default value: False, output will be integer 0/1. Set to True 
     '''
+    if isinstance(exp_mat, LabeledMatrix):
+        return exp_mat.like(isRCA(exp_mat.values, isBoolean));
     RCA = rca(exp_mat);
     hasRCA = (RCA >= 1.0);
     if isBoolean:
@@ -84,4 +141,110 @@ def isRCA(exp_mat: np.ndarray,
         return hasRCA.astype(int)
 
 
-    
+
+
+def lq_cells(region, item, value, region_labels = None, item_labels = None):
+    '''
+    RCA of each (item, region) cell of long-format records. Returns
+    (item_labels, region_labels, cell_item, cell_region, cell_rca, inverse),
+    with 'inverse' the cell of each record (-1 for records left out).
+    '''
+    region = np.asarray(region);
+    item = np.asarray(item);
+    value = np.asarray(value, dtype = float);
+    if region.ndim != 1 or item.shape != region.shape or value.shape != region.shape:
+        raise ValueError("'region', 'item' and 'value' must be 1-d arrays of the same length, but currently their shapes are {a}, {b} and {c}.".format(a=region.shape, b=item.shape, c=value.shape));
+
+    (item_labels, item_idx) = factorize(item, item_labels);
+    (region_labels, region_idx) = factorize(region, region_labels);
+    isIn = (item_idx >= 0) & (region_idx >= 0);
+    if not np.all(isIn):
+        item_idx = item_idx[isIn];
+        region_idx = region_idx[isIn];
+        value = value[isIn];
+
+    # Duplicated records of the same cell are added up first, then negative
+    # cells are corrected to zero, as in 'rca'
+    (cell, inverse) = factorize(item_idx.astype(np.int64) * len(region_labels) + region_idx);
+    cell_value = np.maximum(np.bincount(inverse, weights = value, minlength = len(cell)), 0);
+    (cell_item, cell_region) = np.divmod(cell, len(region_labels));
+
+    reg_sum = np.bincount(cell_region, weights = cell_value, minlength = len(region_labels));
+    reg_sum[reg_sum<=0]=0.123;
+    prod_sum = np.bincount(cell_item, weights = cell_value, minlength = len(item_labels));
+    grandtotal = np.sum(reg_sum);
+    if np.sum(cell_value) <= 0:
+        raise ValueError("'value' has no positive values.");
+
+    ExpWorldShare = prod_sum/grandtotal;
+    ExpWorldShare[ExpWorldShare<=0]=0.123;
+    cell_rca = (cell_value/reg_sum[cell_region]) / ExpWorldShare[cell_item];
+
+    if not np.all(isIn):
+        full = np.full(len(isIn), -1);
+        full[isIn] = inverse;
+        inverse = full;
+    return (item_labels, region_labels, cell_item, cell_region, cell_rca, inverse);
+
+
+
+def rca_triples(region, item, value,
+                output: str = 'triples',
+                region_labels: np.ndarray | None = None,
+                item_labels: np.ndarray | None = None):
+    '''
+    Generate RCA (location quotients) from long-format records, e.g. the
+    (region, industry, employment) of each establishment, without building
+    the dense item x region matrix.
+
+    parameters
+    ----
+    region : np.ndarray, 1-d. Region code of each record.
+    item   : np.ndarray, 1-d. Product/industry code of each record.
+    value  : np.ndarray, 1-d. Export/employment of each record. Records of
+             the same (item, region) are added up.
+    output : "triples" (default) or "sparse".
+             * "triples" => 1-d array with the RCA of the cell of each
+               record, in the order of the input (NaN for records left out,
+               see below).
+             * "sparse"  => LabeledMatrix of a scipy sparse (CSR) matrix,
+               Row: item, Col: region, labeled with the sorted codes.
+    region_labels, item_labels : np.ndarray, 1-d. Optional. Fixed sorted
+             sets of codes; records with other codes are left out. By
+             default, all the codes in the data are used.
+    '''
+    if output not in ['triples', 'sparse']:
+        raise ValueError("'output' must be either 'triples' or 'sparse', but currently it is {}.".format(output));
+    if output == 'sparse' and sps is None:
+        raise ValueError("output = 'sparse' needs scipy, which is not installed.");
+
+    (item_labels, region_labels, cell_item, cell_region, cell_rca, inverse) = lq_cells(region, item, value, region_labels, item_labels);
+    if output == 'triples':
+        return np.where(inverse >= 0, cell_rca[inverse], np.nan);
+
+    RCA = sps.csr_matrix((cell_rca, (cell_item, cell_region)), shape = (len(item_labels), len(region_labels)));
+    RCA.eliminate_zeros();
+    return LabeledMatrix(RCA, item_labels, region_labels);
+
+
+
+def isRCA_triples(region, item, value,
+                  isBoolean: bool = False,
+                  output: str = 'triples',
+                  region_labels: np.ndarray | None = None,
+                  item_labels: np.ndarray | None = None):
+    '''
+    Whether the region of each long-format record has comparative advantage
+    in its item, see 'rca_triples' for the parameters. Records left out (with
+    codes not in 'region_labels' or 'item_labels') get False.
+    '''
+    RCA = rca_triples(region, item, value, output, region_labels, item_labels);
+    if output == 'triples':
+        hasRCA = (RCA >= 1.0);
+    else:
+        hasRCA = RCA.like(RCA.values >= 1.0);
+    if isBoolean:
+        return hasRCA;
+    if output == 'triples':
+        return hasRCA.astype(int);
+    return RCA.like(hasRCA.values.astype(int));
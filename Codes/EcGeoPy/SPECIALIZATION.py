@@ -0,0 +1,126 @@
+#!/usr/bin/python3.11
+# -*- coding: utf-8 -*-
+
+# Krugman specialization index and dissimilarity of sectoral structures,
+# from gross export (or employment) data in the same layout as 'rca':
+#        Row: Product/Task/ etc.
+#        Col: Region
+#
+# Both work on the shares of each product in the exports of each region,
+# exp_mat / reg_sum, the same shares as in 'rca'. Negative exports will be
+# corrected to zero, and a region with completely zero exports has all of its
+# shares set to zero.
+
+
+import numpy as np
+from .RCA import is_sparse
+from .PAIRWISE import pairwise_l1
+
+
+def region_shares(exp_mat, dtype = np.float64):
+    '''
+    Share of each product in the exports of each region (same shape as
+    'exp_mat', sparse if 'exp_mat' is sparse), and the share of each product
+    in the world exports.
+    '''
+    if is_sparse(exp_mat):
+        exp_mat = exp_mat.tocsc().astype(dtype);
+        exp_mat.data[exp_mat.data < 0] = 0;
+        exp_mat.eliminate_zeros();
+        reg_sum = np.asarray(exp_mat.sum(axis = 0)).ravel();
+        reg_sum[reg_sum == 0] = 0.123;
+        shares = exp_mat.multiply(1.0 / reg_sum.reshape(1, -1)).tocsc();
+        prd_sum = np.asarray(exp_mat.sum(axis = 1)).ravel();
+    else:
+        exp_mat = np.maximum(exp_mat, 0, dtype = dtype);
+        reg_sum = exp_mat.sum(axis = 0);
+        reg_sum[reg_sum == 0] = 0.123;
+        prd_sum = exp_mat.sum(axis = 1);
+        shares = np.divide(exp_mat, reg_sum, out = exp_mat);
+    world_share = prd_sum / max(prd_sum.sum(), 0.123);
+    return (shares, world_share);
+
+
+
+def krugman_specialization(exp_mat) -> np.ndarray:
+    '''
+    Generate the Krugman specialization index of every region, i.e. the L1
+    distance between the sectoral structure of the region and that of the
+    world:
+        K_r = sum_p | s_pr - s_p |
+    with s_pr the share of product p in region r, and s_p in the world. It is
+    between 0 (same structure as the world) and 2.
+
+    Parameters:
+    -----
+    exp_mat: numpy 2-d array or scipy sparse matrix.
+             Row: Product/Task/ etc.
+             Col: Region
+    '''
+    if exp_mat.ndim != 2:
+        raise ValueError("'exp_mat' must be a 2-d array, but currently its dimension is {}.".format(exp_mat.ndim));
+    (shares, world_share) = region_shares(exp_mat);
+
+    if is_sparse(shares):
+        # Zero shares contribute s_p each: K_r = sum_p s_p + sum_nz (|s_pr - s_p| - s_p)
+        w = world_share[shares.indices];
+        dev = np.abs(shares.data - w) - w;
+        col = np.repeat(np.arange(shares.shape[1]), np.diff(shares.indptr));
+        K = world_share.sum() + np.bincount(col, weights = dev, minlength = shares.shape[1]);
+    else:
+        K = np.abs(shares - world_share.reshape(-1, 1)).sum(axis = 0);
+
+    return K;
+
+
+
+def krugman_dissimilarity(exp_mat,
+                          block_size:int = 256,
+                          k:int | None = None,
+                          n_jobs:int = 1,
+                          dtype = np.float32) -> np.ndarray | tuple[np.ndarray, np.ndarray]:
+    '''
+    Generate the Krugman dissimilarity index between all pairs of regions,
+    i.e. the L1 distance between their sectoral structures:
+        K_rs = sum_p | s_pr - s_ps |
+    between 0 (same structure) and 2 (no product in common).
+
+    The distances are computed in blocks of region pairs (see
+    PAIRWISE.pairwise_l1), from the shares held in 'dtype'.
+
+    Parameters:
+    -----
+    exp_mat: numpy 2-d array or scipy sparse matrix (the shares are held as
+             a dense regions x products array of 'dtype').
+             Row: Product/Task/ etc.
+             Col: Region
+
+    block_size: integer. Number of regions per block. Default 256.
+
+    k: integer. Optional. When supplied, only the k most similar (nearest)
+       regions of each region are kept, and the function returns a tuple
+       (idx, val) of two arrays in the shape of (number of regions, k), with
+       the column indices and the dissimilarities of the peers, nearest
+       first. Otherwise the full square matrix is returned.
+
+    n_jobs: integer. Number of threads computing blocks. Default 1.
+
+    dtype: numpy dtype of the shares and of the output. Default np.float32.
+           The shares are rounded to 'dtype' before any distance is
+           computed, so float32 gives distances with float32 precision
+           (about 7 significant digits, i.e. absolute errors of the order
+           of 1e-6 with a few thousand products), whether or not scipy
+           upcasts each block to float64 in 'cdist'. It halves the memory
+           of the shares and of the output, but not of the float64 block
+           temporaries of 'cdist' (block_size x block_size distances and
+           the upcast block of shares). Use np.float64 for full precision.
+    '''
+    if exp_mat.ndim != 2:
+        raise ValueError("'exp_mat' must be a 2-d array, but currently its dimension is {}.".format(exp_mat.ndim));
+    (shares, world_share) = region_shares(exp_mat, dtype = dtype);
+    if is_sparse(shares):
+        shares = shares.T.toarray();
+    else:
+        shares = shares.T;
+
+    return pairwise_l1(shares, block_size = block_size, k = k, n_jobs = n_jobs, dtype = dtype);
@@ -0,0 +1,252 @@
+#!/usr/bin/python3.11
+# -*- coding: utf-8 -*-
+
+# Streaming (chunked) computation of entropy, KL divergence and related /
+# unrelated variety from long-format records, e.g. establishment level
+# employment data that is too large to be held as one matrix.
+#
+# Input: chunks of three 1-d arrays of the same length
+#        region: region code of each record
+#        cls:    class code (product/industry/task etc) of each record
+#        value:  value of each record (e.g. employment, exports)
+#
+# Each accumulator keeps the per-class, per-region sums only. Accumulators
+# built on different chunks (e.g. in different worker processes) can be
+# merged, and finalizing gives the same result as calling the in-memory
+# function on the accumulated class x region matrix.
+
+
+import numpy as np
+from typing import Any
+from .ENTROPY import entropy, kl
+from .VARIETY import unrel_variety, rel_variety
+
+
+def label_slots(codes: np.ndarray | None, sorter: np.ndarray | None, new: np.ndarray):
+    '''
+    Slot (position in 'codes', the labels in the order they were first seen)
+    of each of the sorted unique labels 'new', appending the unseen ones.
+
+    Returns
+    -----
+    (slots, codes, sorter): with 'sorter' the argsort of the updated 'codes'.
+    '''
+    if codes is None:
+        return (np.arange(len(new)), new, np.arange(len(new)));
+    sorted_codes = codes[sorter];
+    found = np.minimum(np.searchsorted(sorted_codes, new), max(len(codes) - 1, 0));
+    isKnown = sorted_codes[found] == new if len(codes) > 0 else np.zeros(len(new), dtype = bool);
+    slots = np.where(isKnown, sorter[found], -1);
+    if not np.all(isKnown):
+        slots[~isKnown] = len(codes) + np.arange(np.count_nonzero(~isKnown));
+        codes = np.concatenate((codes, new[~isKnown]));
+        sorter = np.argsort(codes, kind = 'stable');
+    return (slots, codes, sorter);
+
+
+def aligned(labels: np.ndarray, x: Any, name: str) -> np.ndarray:
+    '''
+    Turn 'x', either a dict keyed by label or an array already aligned with
+    'labels', into an array aligned with 'labels'.
+    '''
+    if isinstance(x, dict):
+        missing = [lab for lab in labels if lab not in x];
+        if len(missing) > 0:
+            raise ValueError("'{a}' has no entry for the following classes: {b}.".format(a=name, b=missing[:10]));
+        return np.asarray([x[lab] for lab in labels]);
+
+    x = np.asarray(x);
+    if x.ndim != 1 or len(x) != len(labels):
+        raise ValueError("'{a}' must be a dict keyed by class, or an 1-d array with one element per class (currently {b}), but currently its shape is {c}.".format(a=name, b=len(labels), c=x.shape));
+    return x;
+
+
+
+class RegionClassAccumulator:
+    '''
+    Per-class, per-region sums of (region, class, value) records.
+
+    The sums are kept in a buffer whose rows and columns follow the order in
+    which the codes were first seen, with spare capacity that doubles when
+    it runs out (as in dynamic arrays), so that new codes do not cost a copy
+    of all the sums at every chunk. They are put in the order of the sorted
+    codes only when read.
+
+    Attributes
+    -----
+    classes: sorted numpy 1-d array of the class codes seen so far.
+    regions: sorted numpy 1-d array of the region codes seen so far.
+    sums:    numpy 2-d array of the sums, in the same layout as the 'mat'
+             input of the in-memory functions (a copy).
+             Row: class, in the order of 'classes'
+             Col: region, in the order of 'regions'
+    '''
+
+    def __init__(self):
+        self.class_codes = None;
+        self.class_sorter = None;
+        self.region_codes = None;
+        self.region_sorter = None;
+        self.buffer = np.zeros([0, 0]);
+
+
+    @property
+    def classes(self) -> np.ndarray | None:
+        return None if self.class_codes is None else self.class_codes[self.class_sorter];
+
+
+    @property
+    def regions(self) -> np.ndarray | None:
+        return None if self.region_codes is None else self.region_codes[self.region_sorter];
+
+
+    @property
+    def sums(self) -> np.ndarray:
+        if self.class_codes is None:
+            return np.zeros([0, 0]);
+        return self.matrix()[0];
+
+
+    def slots(self, classes: np.ndarray, regions: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        '''
+        Rows and columns of the buffer for sorted unique class and region
+        codes, making room for the new ones.
+        '''
+        (rows, self.class_codes, self.class_sorter) = label_slots(self.class_codes, self.class_sorter, classes);
+        (cols, self.region_codes, self.region_sorter) = label_slots(self.region_codes, self.region_sorter, regions);
+        (n_rows, n_cols) = (len(self.class_codes), len(self.region_codes));
+        (cap_rows, cap_cols) = self.buffer.shape;
+        if n_rows > cap_rows or n_cols > cap_cols:
+            buffer = np.zeros([max(n_rows, 2 * cap_rows) if n_rows > cap_rows else cap_rows,
+                               max(n_cols, 2 * cap_cols) if n_cols > cap_cols else cap_cols]);
+            buffer[:cap_rows, :cap_cols] = self.buffer;
+            self.buffer = buffer;
+        return (rows, cols);
+
+
+    def update(self, region: np.ndarray, cls: np.ndarray, value: np.ndarray):
+        '''
+        Add a chunk of records.
+
+        Parameters
+        -----
+        region, cls, value: numpy 1-d arrays with the same number of elements.
+        '''
+        region = np.asarray(region);
+        cls = np.asarray(cls);
+        value = np.asarray(value, dtype = float);
+        if region.ndim != 1 or cls.ndim != 1 or value.ndim != 1:
+            raise ValueError("'region', 'cls' and 'value' must be 1-d arrays, but currently their dimensions are {a}, {b} and {c}.".format(a=region.ndim, b=cls.ndim, c=value.ndim));
+        if not (len(region) == len(cls) == len(value)):
+            raise ValueError("'region', 'cls' and 'value' must have the same number of elements, but currently they have {a}, {b} and {c}.".format(a=len(region), b=len(cls), c=len(value)));
+        if len(value) == 0:
+            return self;
+
+        (ucls, icls) = np.unique(cls, return_inverse = True);
+        (ureg, ireg) = np.unique(region, return_inverse = True);
+        (rows, cols) = self.slots(ucls, ureg);
+
+        # Aggregate the chunk by cell first, then add into the sums
+        cell = rows[icls.ravel()] * self.buffer.shape[1] + cols[ireg.ravel()];
+        (ucell, icell) = np.unique(cell, return_inverse = True);
+        self.buffer.reshape(-1)[ucell] += np.bincount(icell.ravel(), weights = value, minlength = len(ucell));
+        return self;
+
+
+    def merge(self, other: 'RegionClassAccumulator'):
+        '''
+        Add the sums of another accumulator (e.g. built in another process).
+        '''
+        if other.class_codes is None:
+            return self;
+        (sums, classes, regions) = other.matrix();
+        (rows, cols) = self.slots(classes, regions);
+        self.buffer[np.ix_(rows, cols)] += sums;
+        return self;
+
+
+    def matrix(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        '''
+        Return (sums, classes, regions), with a copy of the sums in the order
+        of the sorted codes.
+        '''
+        if self.class_codes is None:
+            raise ValueError("No records have been added yet.");
+        sums = self.buffer[np.ix_(self.class_sorter, self.region_sorter)];
+        return (sums, self.classes, self.regions);
+
+
+
+class EntropyAccumulator(RegionClassAccumulator):
+    '''
+    Streaming version of ENTROPY.entropy. See RegionClassAccumulator.
+    '''
+    def finalize(self, base: str = 'e') -> np.ndarray:
+        '''
+        Entropy of each region, in the order of 'regions'.
+        '''
+        (mat, classes, regions) = self.matrix();
+        return entropy(mat, base = base);
+
+
+
+class KLAccumulator(RegionClassAccumulator):
+    '''
+    Streaming version of ENTROPY.kl. See RegionClassAccumulator.
+    '''
+    def finalize(self, reference: Any = None, base: str = 'e') -> np.ndarray:
+        '''
+        Kullback–Leibler divergence of each region, in the order of 'regions'.
+
+        reference: Optional. Dict keyed by class, or 1-d array aligned with
+                   'classes'. When not supplied, the total over all regions
+                   is used as the reference.
+        '''
+        (mat, classes, regions) = self.matrix();
+        if reference is None:
+            reference = mat.sum(axis = 1);
+        else:
+            reference = aligned(classes, reference, 'reference');
+        return kl(mat, reference, base = base);
+
+
+
+class UnrelVarietyAccumulator(RegionClassAccumulator):
+    '''
+    Streaming version of VARIETY.unrel_variety. See RegionClassAccumulator.
+    '''
+    def finalize(self, flag: Any, ref: Any = None) -> np.ndarray:
+        '''
+        Unrelated variety of each region, in the order of 'regions'.
+
+        flag: Dict keyed by class, or 1-d array aligned with 'classes',
+              giving the cluster of each class.
+        ref:  Optional. Dict keyed by class, or 1-d array aligned with
+              'classes'.
+        '''
+        (mat, classes, regions) = self.matrix();
+        flag = aligned(classes, flag, 'flag');
+        if ref is not None:
+            ref = aligned(classes, ref, 'ref');
+        return unrel_variety(mat, flag, ref);
+
+
+
+class RelVarietyAccumulator(RegionClassAccumulator):
+    '''
+    Streaming version of VARIETY.rel_variety. See RegionClassAccumulator.
+    '''
+    def finalize(self, flag: Any, ref: Any = None) -> np.ndarray:
+        '''
+        Related variety of each region, in the order of 'regions'.
+
+        flag: Dict keyed by class, or 1-d array aligned with 'classes',
+              giving the cluster of each class.
+        ref:  Optional. Dict keyed by class, or 1-d array aligned with
+              'classes'.
+        '''
+        (mat, classes, regions) = self.matrix();
+        flag = aligned(classes, flag, 'flag');
+        if ref is not None:
+            ref = aligned(classes, ref, 'ref');
+        return rel_variety(mat, flag, ref);
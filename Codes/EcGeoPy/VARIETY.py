@@ -14,49 +14,168 @@ import numpy as np;
 from typing import Tuple, List, Any;
 from .ENTROPY import entropy, kl;
 
+def factorize_flag(flag: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    '''
+    Factorize the flags once, so that rows of the same class can be reduced
+    as contiguous segments.
+    
+    Returns
+    -----
+    (order, starts, unique_flag, inverse):
+        order: the row sequence that puts rows of the same class together 
+               (None when the flags are already sorted).
+        starts: first row of each class in the sorted sequence.
+        unique_flag: sorted unique flags.
+        inverse: class number of each row.
+    '''
+    unique_flag, inverse = np.unique(flag, return_inverse = True);
+    inverse = inverse.ravel();
+    counts = np.bincount(inverse, minlength = len(unique_flag));
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]));
+    if np.all(inverse[1:] >= inverse[:-1]):
+        order = None;
+    else:
+        order = np.argsort(inverse, kind = 'stable');
+    return (order, starts, unique_flag, inverse);
+
+
+
+def segment_sum(mat: np.ndarray,
+                starts: np.ndarray) -> np.ndarray:
+    '''
+    Sum of rows of 'mat' within each segment starting at 'starts' (i.e. 
+    np.add.reduceat along axis 0, but empty segments give zeros).
+    '''
+    dtype = np.result_type(mat.dtype, float) if mat.ndim == 2 else mat.dtype;
+    out = np.zeros((len(starts),) + mat.shape[1:], dtype = dtype);
+    if mat.shape[0] == 0 or len(starts) == 0:
+        return out;
+    
+    # np.add.reduceat gives the row at 'start' (not 0) for empty segments,
+    # and does not accept a start at the end of 'mat'
+    ends = np.append(starts[1:], mat.shape[0]);
+    isFull = ends > starts;
+    out[isFull] = np.add.reduceat(mat, starts[isFull], axis = 0, dtype = dtype);
+    return out;
+
+
+
 def group_by_flag(mat: np.ndarray,
                   flag: np.ndarray) -> Tuple[List[np.ndarray], np.ndarray]:
+    flag = np.asarray(flag);
     if mat.ndim > 2:
         raise ValueError("'mat' must be either 1-d or 2-d array, but currently its dimension is {}.".format(mat.ndim));
     if flag.ndim >1:
         raise ValueError("'flag' must be an 1-d array, but currently its dimension is {}.".format(flag.ndim));
     if mat.shape[0]!=flag.shape[0]:
-        raise ValueError("The shapes of 'mat' and 'flag' must correspond, but currently their shapes are {a} and {b}.".format(mat.shape, flag.shape));
+        raise ValueError("The shapes of 'mat' and 'flag' must correspond, but currently their shapes are {a} and {b}.".format(a=mat.shape, b=flag.shape));
     
-    unique_flag = np.unique(flag);
-    if mat.ndim == 1:
-        grouped = [mat[flag == doge] for doge in unique_flag];
-    else:
-        grouped = [mat[flag == doge,:] for doge in unique_flag];
+    # One sort of the rows, the groups are then views of the sorted copy.
+    (order, starts, unique_flag, inverse) = factorize_flag(flag);
+    mat_sorted = mat if order is None else mat[order];
+    grouped = np.split(mat_sorted, starts[1:], axis = 0);
     
     return (grouped, unique_flag);
 
 
 
+def group_entropy(mat: np.ndarray,
+                  flag: np.ndarray,
+                  ref: None|np.ndarray = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    '''
+    Sums and entropies of each class, computed with one sort of the rows and
+    segment reductions, without splitting 'mat' into groups.
+    
+    Parameters
+    -----
+    mat: numpy 1-d or 2-d array. Same as in 'unrel_variety'.
+    
+    flag: numpy 1-d array. Class of each row of 'mat'.
+    
+    ref: numpy 1-d array. Optional. When supplied, the negative 
+         Kullback–Leibler divergence from 'ref' within each class is 
+         returned instead of the entropy.
+    
+    Returns
+    -----
+    (mat_class, entropy_perClass, unique_flag):
+        mat_class: sum of 'mat' in each class. (classes) or (classes x regions).
+        entropy_perClass: entropy (or -KL) within each class, same shape as
+                          'mat_class'.
+        unique_flag: the sorted unique classes.
+    '''
+    (order, starts, unique_flag, inverse) = factorize_flag(flag);
+    mat_sorted = mat if order is None else mat[order];
+    mat_class = segment_sum(mat_sorted, starts);
+    
+    # One float copy of the rows in sorted order (the sorted copy itself when
+    # there is one), worked on in place below. Same treatment of negatives
+    # and empty classes as in ENTROPY.
+    mat_sorted = mat_sorted.astype(float, copy = order is None);
+    if mat_sorted.size > 0 and mat_sorted.min() < 0:
+        np.maximum(mat_sorted, 0, out = mat_sorted);
+        total = segment_sum(mat_sorted, starts);
+    else:
+        total = mat_class.astype(float);
+    isEmpty = (total==0);
+    total[isEmpty] = 6758;
+    
+    # Within a class of total S, -sum(p log p) = log(S) - sum(x log x)/S, and
+    # -KL = entropy + sum(p log q), so only the segment sums of x*log(x)
+    # (or of x*(log(x) - log(q))) are needed.
+    if ref is not None:
+        seg = inverse if order is None else inverse[order];
+        ref_sorted = ref if order is None else ref[order];
+        total_ref = segment_sum(ref_sorted, starts).astype(float);
+        total_ref[total_ref==0] = 9684;
+        q = ref_sorted / total_ref[seg];
+        luigi = q.copy();
+        luigi[q==0] = 0.2333;
+        logq = np.log(luigi);
+        if mat_sorted.ndim == 2:
+            logq = logq.reshape(-1, 1);
+    
+    # x*log(x) in place, a block of rows at a time
+    for start in range(0, mat_sorted.shape[0], 4096):
+        block = mat_sorted[start:start+4096];
+        logx = np.zeros(block.shape);
+        np.log(block, out = logx, where = block>0);
+        if ref is not None:
+            logx -= logq[start:start+4096];
+        block *= logx;
+    entropy_perClass = np.log(total) - segment_sum(mat_sorted, starts)/total;
+    del mat_sorted;
+    
+    entropy_perClass[isEmpty] = 0;
+    
+    return (mat_class, entropy_perClass, unique_flag);
+
+
+
 
 def unrel_variety(mat: np.ndarray, 
                   flag: np.ndarray|List[Any], 
                   ref: None|np.ndarray = None) -> np.ndarray|float:
+    flag = np.asarray(flag);
     if mat.ndim > 2:
         raise ValueError("'mat' must be either 1-d or 2-d array, but currently its dimension is {}.".format(mat.ndim));
     if flag.ndim >1:
         raise ValueError("'flag' must be an 1-d array, but currently its dimension is {}.".format(flag.ndim));
     if mat.shape[0]!=flag.shape[0]:
-        raise ValueError("The shapes of 'mat' and 'flag' must correspond, but currently their shapes are {a} and {b}.".format(mat.shape, flag.shape));
+        raise ValueError("The shapes of 'mat' and 'flag' must correspond, but currently their shapes are {a} and {b}.".format(a=mat.shape, b=flag.shape));
     
     if ref is not None:
         if ref.ndim>1:
             raise ValueError("'ref' must be an 1-d array, but currently its dimension is {}.".format(ref.ndim));
         if ref.shape[0]!=mat.shape[0]:
-            raise ValueError("The shapes of 'mat' and 'ref' must correspond, but currently their shapes are {a} and {b}.".format(mat.shape, ref.shape));
+            raise ValueError("The shapes of 'mat' and 'ref' must correspond, but currently their shapes are {a} and {b}.".format(a=mat.shape, b=ref.shape));
     
-    (umat, uflag) = group_by_flag(mat, flag);
-    mat_class = np.asarray([np.sum(x, axis = 0) for x in umat]);
+    (order, starts, uflag, inverse) = factorize_flag(flag);
+    mat_class = segment_sum(mat if order is None else mat[order], starts);
     if ref is None:
         return entropy(mat_class);
     else:
-        (uref, uflag) = group_by_flag(ref, flag);
-        ref_class = np.asarray([np.sum(x) for x in uref]);
+        ref_class = segment_sum(ref if order is None else ref[order], starts);
         return -kl(mat_class, ref_class);
 
 
@@ -65,31 +184,122 @@ def unrel_variety(mat: np.ndarray,
 def rel_variety(mat: np.ndarray, 
                   flag: np.ndarray|List[Any], 
                   ref: None|np.ndarray = None) -> np.ndarray|float:
+    flag = np.asarray(flag);
     if mat.ndim > 2:
         raise ValueError("'mat' must be either 1-d or 2-d array, but currently its dimension is {}.".format(mat.ndim));
     if flag.ndim >1:
         raise ValueError("'flag' must be an 1-d array, but currently its dimension is {}.".format(flag.ndim));
     if mat.shape[0]!=flag.shape[0]:
-        raise ValueError("The shapes of 'mat' and 'flag' must correspond, but currently their shapes are {a} and {b}.".format(mat.shape, flag.shape));
+        raise ValueError("The shapes of 'mat' and 'flag' must correspond, but currently their shapes are {a} and {b}.".format(a=mat.shape, b=flag.shape));
     
     if ref is not None:
         if ref.ndim>1:
             raise ValueError("'ref' must be an 1-d array, but currently its dimension is {}.".format(ref.ndim));
         if ref.shape[0]!=mat.shape[0]:
-            raise ValueError("The shapes of 'mat' and 'ref' must correspond, but currently their shapes are {a} and {b}.".format(mat.shape, ref.shape));
+            raise ValueError("The shapes of 'mat' and 'ref' must correspond, but currently their shapes are {a} and {b}.".format(a=mat.shape, b=ref.shape));
     
-    (umat, uflag) = group_by_flag(mat, flag);
-    mat_class = np.asarray([np.sum(x, axis=0) for x in umat]);
+    (mat_class, entropy_perClass, uflag) = group_entropy(mat, flag, ref);
     if mat.ndim ==1:
         wgt_class = mat_class/np.sum(mat_class, axis = 0, keepdims = True);
     else:
         wgt_class = mat_class/np.sum(mat_class, axis = 0);
     
-    if ref is None:
-        entropy_perClass = np.asarray([entropy(x) for x in umat]);
-    else:
-        (uref, uflag) = group_by_flag(ref, flag);
-        entropy_perClass = np.asarray([0.0 - kl(x[0],x[1])   for x in zip(umat, uref)]);
-    
     return np.sum(entropy_perClass * wgt_class, axis = 0);
 
+
+
+
+def entropy_decomposition(mat: np.ndarray,
+                          flags: List[np.ndarray]) -> dict:
+    '''
+    Decompose the entropy of each region over a hierarchy of nested 
+    classifications (e.g. HS6 -> HS4 -> HS2 -> section), with one sort of
+    the rows and one pass over the data.
+    
+    At each level, the total entropy over the rows of 'mat' is split into the
+    entropy between the classes of that level (i.e. the unrelated variety)
+    and the weighted entropy within the classes (i.e. the related variety):
+        total = between[l] + within[l]
+    
+    Parameters
+    -----
+    mat: numpy 1-d or 2-d array.
+        Row: Product/Task/ etc. at the finest level.
+        Col: Region
+    
+    flags: list of numpy 1-d arrays, one per level from the finest to the 
+        coarsest. Each has the same number of elements as the number of
+        rows in 'mat', and each class must be nested in a single class of
+        the next (coarser) level.
+    
+    Returns
+    -----
+    dict with:
+        'total':   entropy over the rows of 'mat', one value per region.
+        'between': entropy between classes, shape (levels,) + (regions,).
+        'within':  weighted entropy within classes, same shape as 'between'.
+    Regions without any positive value get zeros.
+    '''
+    if mat.ndim > 2:
+        raise ValueError("'mat' must be either 1-d or 2-d array, but currently its dimension is {}.".format(mat.ndim));
+    if len(flags) == 0:
+        raise ValueError("'flags' must contain at least one level.");
+    
+    flags = [np.asarray(x) for x in flags];
+    for (i, flag) in enumerate(flags):
+        if flag.ndim > 1:
+            raise ValueError("Each of 'flags' must be an 1-d array, but currently level {a} has dimension {b}.".format(a=i, b=flag.ndim));
+        if flag.shape[0] != mat.shape[0]:
+            raise ValueError("The shapes of 'mat' and 'flags' must correspond, but currently the shape of 'mat' is {a} and level {i} of 'flags' is {b}.".format(a=mat.shape, i=i, b=flag.shape));
+    
+    # One sort of the rows: coarsest level first, then finer ones.
+    inverses = [np.unique(x, return_inverse = True)[1].ravel() for x in flags];
+    order = np.lexsort(inverses);
+    sorted_flags = [x[order] for x in inverses];
+    
+    # Start of each class of each level in the sorted rows. Nesting means the
+    # boundaries of a coarse level are also boundaries of all finer levels,
+    # and each class occupies a single run of rows.
+    boundaries = [];
+    changed = np.zeros(max(mat.shape[0]-1, 0), dtype = bool);
+    for (i, x) in reversed(list(enumerate(sorted_flags))):
+        changed = changed | (x[1:] != x[:-1]);
+        starts = np.concatenate(([0], np.flatnonzero(changed) + 1));
+        if len(starts) != inverses[i].max() + 1:
+            raise ValueError("The classes in 'flags' must be nested, but level {} has classes split over several classes of a coarser level.".format(i));
+        boundaries.insert(0, starts);
+    
+    mat_sorted = mat[order];
+    if mat_sorted.size > 0 and mat_sorted.min() < 0:
+        mat_sorted = np.maximum(mat_sorted, 0);
+    
+    # Segment sums of x and x*log(x) at the finest level, everything else
+    # is aggregated from these.
+    xlogx = np.zeros(mat_sorted.shape);
+    np.log(mat_sorted, out = xlogx, where = mat_sorted>0);
+    xlogx *= mat_sorted;
+    sum_fine = segment_sum(mat_sorted, boundaries[0]);
+    xlogx_total = np.sum(segment_sum(xlogx, boundaries[0]), axis = 0);
+    del xlogx;
+    
+    total = np.sum(sum_fine, axis = 0).astype(float);
+    isEmpty = (total==0);
+    total = np.where(isEmpty, 6758, total);
+    
+    slogs_total = [];
+    for starts in boundaries:
+        sum_class = segment_sum(sum_fine, np.searchsorted(boundaries[0], starts));
+        slogs = np.zeros(sum_class.shape);
+        np.log(sum_class, out = slogs, where = sum_class>0);
+        slogs_total.append(np.sum(sum_class * slogs, axis = 0));
+    slogs_total = np.asarray(slogs_total);
+    
+    Entro_total = np.log(total) - xlogx_total/total;
+    between = np.log(total) - slogs_total/total;
+    within = (slogs_total - xlogx_total)/total;
+    
+    Entro_total = np.where(isEmpty, 0, Entro_total);
+    between = np.where(isEmpty, 0, between);
+    within = np.where(isEmpty, 0, within);
+    
+    return {'total': Entro_total, 'between': between, 'within': within};
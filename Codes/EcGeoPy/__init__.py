@@ -2,11 +2,20 @@
 # -*- coding: utf-8 -*-
 
 # EcGeoPy/__init__.py
-from .RCA import rca, isRCA
+from .RCA import rca, isRCA, rca_triples, isRCA_triples
 from .PRODY import prody, expy
-from .INEQUALITY import gini, robin_hood, theil, herfindahl
-from .COMPLEXITY import relatedness, pci, eci, ci_calibrate
+from .INEQUALITY import gini, robin_hood, theil, herfindahl, herfindahl_grouped, gini_grouped, theil_grouped, robin_hood_grouped, InequalitySketch, theil_decomposition, inequality_report, bootstrap_ci, RollingInequality, rolling_inequality
+from .COMPLEXITY import relatedness, region_similarity, pci, eci, ci_calibrate
 from .DENSITIES import rel_density, compl_rel_density
-from .ENTROPY import entropy, kl
-from .VARIETY import unrel_variety, rel_variety
+from .ENTROPY import entropy, kl, pairwise_divergence
+from .VARIETY import unrel_variety, rel_variety, entropy_decomposition
+from .AGGLOMERATION import ellison_glaeser, locational_gini
+from .SPECIALIZATION import krugman_specialization, krugman_dissimilarity
+from .BACI import read_baci, baci_matrix, load_baci
+from .DATABASE import get_connection, close_connections, create_indexes, fetch_arrays, export_matrix, pwt_values, iso3_list, product_names
+from .LABELED import LabeledMatrix, LabeledVector, align_cols, align_rows
+from .CONCORDANCE import Concordance, flag_levels
+from .PANEL import PanelStore
+from .CACHE import ResultCache, set_cache, get_cache
+from .STREAMING import EntropyAccumulator, KLAccumulator, UnrelVarietyAccumulator, RelVarietyAccumulator
 from .VERSION import version, __VERSION__
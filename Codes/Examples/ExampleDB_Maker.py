@@ -3,6 +3,7 @@
 
 import sqlite3;
 import pandas as pd;
+import EcGeoPy as egp;
 
 PWT_DB = 'PWT2023.db';
 EXPORT_DB = 'HS2_Export2024.db';
@@ -15,10 +16,9 @@ meow.to_sql('pwt2023', conn, if_exists='replace', index=False);
 conn.close();
 
 
-with open('data/BACI_HS96_2d_2024_v202601.csv', 'r') as f:
-    ExportData = [x.strip().split(',')  for x in f.readlines()[1:]];
-
-ExportData =[(int(x[0]),int(x[1]), float(x[2]) ) for x in  ExportData ];
+# Typed columns parsed by numpy (see EcGeoPy.BACI), no Python work per row
+baci = egp.read_baci('data/BACI_HS96_2d_2024_v202601.csv');
+ExportData = zip(baci['i'].tolist(), baci['hs2'].tolist(), baci['v'].tolist());
 
 
 with open('data/country_codes_V202601.csv', 'r') as f:
@@ -48,6 +48,10 @@ cursor.executemany('''INSERT INTO Export2024
     (origin_id, hs2, exp_value) 
     VALUES (?,?,?)''', ExportData);
 
+# Index for the queries by region and product (see EcGeoPy.DATABASE)
+cursor.execute('''CREATE INDEX idx_Export2024_origin_hs2 
+    ON Export2024 (origin_id, hs2)''');
+
 
 cursor.execute('''
     CREATE TABLE Iso3Info (
@@ -61,6 +65,8 @@ cursor.executemany('''INSERT INTO Iso3Info
     (origin_id, iso3, name) 
     VALUES (?,?,?)''', Iso3Info);
 
+cursor.execute('''CREATE INDEX idx_Iso3Info_iso3 ON Iso3Info (iso3)''');
+
 
 cursor.execute('''
     CREATE TABLE HsInfo (
@@ -1,6 +1,4 @@
-import numpy as np
 import EcGeoPy as egp
-import sqlite3
 
 '''
 The codes are just for illustrative purpose,... for illustrating the 
@@ -20,15 +18,6 @@ M$FT studio, or just in console-alike places like kate / emacs.
 '''
 
 
-def GetSql(query, path):
-    conn = sqlite3.connect(path);
-    cursor = conn.cursor(); 
-    cursor.execute(query);
-    rows = cursor.fetchall();
-    conn.close();
-    return rows;
-
-
 # Import databases
 PWT_DB = 'data/PWT2023.db';
 EXPORT_DB = 'data/HS2_Export2024.db';
@@ -37,80 +26,42 @@ EXPORT_DB = 'data/HS2_Export2024.db';
 
 # use the countries/regions with at least a million population, and are 
 # common in both BACI and PWT datasets. 
-cmd = '''SELECT countrycode FROM pwt2023 WHERE pop>=1''';
-
-GDP_DATA = GetSql(cmd, PWT_DB);
-iso3_PWT =  [x[0] for x in GDP_DATA];
-
-cmd = '''SELECT iso3 from Iso3Info'''
-iso3_BACI = [x[0] for x in GetSql(cmd, EXPORT_DB)];
-
+(GDP_DATA, iso3_PWT) = egp.pwt_values(PWT_DB, ['rgdpo/pop'], where = 'pop>=1');
+iso3_BACI = egp.iso3_list(EXPORT_DB);
 
 iso3 = sorted(set(iso3_BACI) & set(iso3_PWT));
 
-cmd = '''
-SELECT countrycode, rgdpo/pop as rgdppc 
-FROM pwt2023
-WHERE countrycode in ("{iso3}")
-ORDER BY countrycode
-'''.format(iso3= '","'.join(iso3))
-rgdppc = GetSql(cmd, PWT_DB);
-
-cmd = '''
-SELECT i.iso3, j.hs2, j.exp_value 
-  FROM  Iso3Info i,
-        Export2024 j
-  WHERE i.origin_id = j.origin_id
-    AND i.iso3 in ("{iso3}")
-    ORDER BY i.iso3,j.hs2
-'''.format(iso3= '","'.join(iso3))
-exports = GetSql(cmd, EXPORT_DB);
-
-# get the set of HS2 that have appeared in the data
-hs2 = sorted(set(x[1] for x in exports));
+(rgdppc, _) = egp.pwt_values(PWT_DB, ['rgdpo/pop'], iso3 = iso3);
+rgdppc = rgdppc[:, 0];
+
+# Matrix containing exports by each country/region's exports, with the 
+# HS2 codes of its rows (those that have appeared in the data) and the iso3
+# codes of its columns
+(ExpMat, hs2, _) = egp.export_matrix(EXPORT_DB, year = 2024, iso3 = iso3);
+hs2 = hs2.tolist();
 
 # Get HS product names
-cmd = '''SELECT hs2, name FROM HsInfo'''
-hs2name = dict({x[0]:x[1].strip() for x in GetSql(cmd, EXPORT_DB)})
+hs2name = egp.product_names(EXPORT_DB);
 
 
 # Number of countries/regions and products
 C_NUM = len(iso3);
 P_NUM = len(hs2);
 
-
-# Generate a mapping (i.e. sequence id) per each iso3 and HS codes.
-cid = dict();
-for i in range(C_NUM):
-    cid.update({iso3[i]:i});
-
-pid = dict();
-for i in range(P_NUM):
-    pid.update({hs2[i]:i});
-
-# mapping from product sequence id to its name
-pid2name = dict({pid[x]:hs2name[x] for x in pid});
-
-
 # Generic preparation has finished.
 
 
 
 
-# Matrix containing exports by each country/region's exports
-ExpMat = np.zeros([P_NUM, C_NUM]);
-for x in exports:
-    ExpMat[ pid[x[1]] ,cid[x[0]] ] = x[2];
-
-
-# RCA of each product in each country/region
-RCA_Mat = egp.rca(ExpMat);
+# RCA of each product in each country/region, labeled by HS2 and iso3 codes
+# (so no dicts of row/column numbers are needed)
+RCA_Mat = egp.rca(egp.LabeledMatrix(ExpMat, hs2, iso3));
 
 # List the countries with the highest and lowest RCA of ...
 # Clock and Watches (HS code = 91, PID = 89)
 hs_example = 91;
-RCA_Watch = RCA_Mat[pid[hs_example], :];
-RCA_Watch = [(iso3[cid], float(val)) for cid, val in enumerate(RCA_Watch)];
+RCA_Watch = RCA_Mat.row(hs_example);
+RCA_Watch = [(str(c), float(val)) for c, val in zip(RCA_Watch.labels, RCA_Watch.values)];
 RCA_Watch.sort(key = lambda x: -x[1])
 print('''
 The country/regions with maximum and minimum RCAs in the HS2 Code {num}:
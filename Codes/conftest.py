@@ -0,0 +1 @@
+# Lets the tests in tests/ import EcGeoPy from this directory.
@@ -0,0 +1,47 @@
+#!/usr/bin/python3.11
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import EcGeoPy as egp
+
+
+def pipeline(X):
+    RCA = egp.rca(X);
+    Entro = egp.entropy(RCA);
+    RCA[0, 0] = 1;                         # results can be changed in place
+    relmat = egp.relatedness(X);
+    RD = egp.rel_density(relmat, egp.isRCA(X));
+    return (Entro, relmat, RD, egp.pci(X), egp.eci(X));
+
+
+
+def test_cache_does_not_change_results(tmp_path):
+    rng = np.random.default_rng(12345);
+    X = rng.random((60, 25)) * (rng.random((60, 25)) < 0.4);
+    X[1, 2] = -3;
+    expected = pipeline(X.copy());
+
+    cache = egp.ResultCache(directory = str(tmp_path));
+    egp.set_cache(cache);
+    try:
+        first = pipeline(X.copy());
+        again = pipeline(X.copy());
+        stats = cache.stats();
+    finally:
+        egp.set_cache(None);
+
+    for (a, b, c) in zip(expected, first, again):
+        np.testing.assert_array_equal(a, b);
+        np.testing.assert_array_equal(a, c);
+    assert stats['misses'] > 0;
+    assert stats['hits_memory'] > 0;
+
+    # Disk tier, from a new cache on the same directory
+    egp.set_cache(egp.ResultCache(directory = str(tmp_path)));
+    try:
+        R = egp.rca(X.copy());
+        R[0, 0] = 1;
+        np.testing.assert_array_equal(egp.rca(X.copy()), egp.rca.__wrapped__(X.copy()));
+        assert egp.get_cache().stats()['hits_disk'] > 0;
+    finally:
+        egp.set_cache(None);
@@ -0,0 +1,48 @@
+#!/usr/bin/python3.11
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import EcGeoPy as egp
+from EcGeoPy.INEQUALITY import gini_One
+
+
+def merged_sketch(values, n_chunks, eps):
+    # One sketch per chunk (as on separate workers), then merged
+    chunks = np.array_split(values, n_chunks);
+    sketches = [egp.InequalitySketch(eps = eps).update(x) for x in chunks];
+    merged = sketches[0];
+    for other in sketches[1:]:
+        merged.merge(other);
+    return merged;
+
+
+
+def test_sketch_bounds_hold_against_exact():
+    rng = np.random.default_rng(54321);
+    values = np.concatenate((rng.lognormal(10, 1.2, 200000), np.zeros(500)));
+    rng.shuffle(values);
+
+    for eps in [0.05, 0.01]:
+        sketch = merged_sketch(values, 7, eps);
+
+        (G, bound) = sketch.gini();
+        exact = gini_One(values.copy());
+        assert abs(G - exact) <= bound;
+        assert bound <= 1.01 * eps;
+
+        (RH, bound) = sketch.robin_hood();
+        assert abs(RH - egp.robin_hood(values.copy())) <= bound + 1e-12;
+
+        for method in ['L', 'T', 'S']:
+            (T, bound) = sketch.theil(method);
+            assert abs(T - egp.theil(values.copy(), method = method)) <= bound + 1e-9;
+
+
+
+def test_sketch_merge_is_order_free():
+    rng = np.random.default_rng(12345);
+    values = rng.pareto(2.5, 50000) + 1;
+    a = merged_sketch(values, 3, 0.01);
+    b = merged_sketch(values[::-1], 5, 0.01);
+    assert abs(a.gini()[0] - b.gini()[0]) < 1e-12;
+    assert abs(a.theil()[0] - b.theil()[0]) < 1e-9;